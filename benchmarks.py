@@ -0,0 +1,465 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+import numpy as np
+
+import telehunting
+
+WORDS = ['hack', 'carding', 'malware', 'exploit', 'cracking', 'free', 'logs', 'combo', 'fresh', 'update',
+         'channel', 'join', 'new', 'tool', 'crypter', 'stealer', 'botnet', 'vpn', 'cheap', 'price']
+
+# Corpus sizes for the suite, --scale picks one instead of --messages
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Per-call latencies kept per stage, larger corpora are sampled down to this many calls
+LATENCY_SAMPLES = 100_000
+
+# Synthetic message text, roughly one in five messages carries a t.me link or @mention,
+# and repost_rate of them are verbatim copies of a recent message (spam channels)
+def iter_synthetic_messages(count, seed=0, repost_rate=0.0, window=10000):
+    rng = random.Random(seed)
+    usernames = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 14))) for _ in range(2000)]
+    recent = deque(maxlen=window)
+    for _ in range(count):
+        if recent and rng.random() < repost_rate:
+            yield rng.choice(recent)
+            continue
+        words = rng.choices(WORDS, k=rng.randint(5, 40))
+        roll = rng.random()
+        if roll < 0.1:
+            words.insert(rng.randrange(len(words)), f"https://t.me/{rng.choice(usernames)}")
+        elif roll < 0.15:
+            words.insert(rng.randrange(len(words)), f"t.me/joinchat/{''.join(rng.choices(string.ascii_letters, k=22))}")
+        elif roll < 0.2:
+            words.insert(rng.randrange(len(words)), f"@{rng.choice(usernames)}")
+        message = ' '.join(words)
+        recent.append(message)
+        yield message
+
+def synthetic_messages(count, seed=0, repost_rate=0.0):
+    return list(iter_synthetic_messages(count, seed, repost_rate))
+
+# The corpus in chunks, so 10M messages never sit in memory at once
+def corpus_chunks(count, seed=0, repost_rate=0.0, chunk_size=10000):
+    messages = iter_synthetic_messages(count, seed, repost_rate)
+    while True:
+        chunk = list(itertools.islice(messages, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def corpus_size(args):
+    return SCALES[args.scale] if args.scale else args.messages
+
+# Extraction and cleaning as they were before the compiled single-pass engine, kept as a baseline
+def legacy_clean_link(link):
+    link = link.split(')')[0].strip()
+    if re.match(r'^[a-zA-Z0-9_]{5,}$', link):
+        return link
+    match = re.search(r't\.me/(?:joinchat/)?([a-zA-Z0-9_-]+)', link)
+    if match:
+        return f'https://t.me/joinchat/{match.group(1)}' if 'joinchat' in link else match.group(1)
+    return None
+
+def legacy_extract_and_clean(text):
+    return [legacy_clean_link(link) for link in re.findall(r't\.me/(?:joinchat/)?[a-zA-Z0-9_-]+', text)]
+
+def timed(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return time.perf_counter() - start
+
+# Run func on every message with corpus generation kept off the clock, timing a sample of the calls
+def measure(func, chunks, total):
+    stride = max(1, total // LATENCY_SAMPLES)
+    latencies = []
+    seconds = 0.0
+    count = 0
+    for chunk in chunks:
+        start = time.perf_counter()
+        for index, item in enumerate(chunk, count):
+            if index % stride:
+                func(item)
+            else:
+                call = time.perf_counter()
+                func(item)
+                latencies.append(time.perf_counter() - call)
+        seconds += time.perf_counter() - start
+        count += len(chunk)
+    return count, seconds, latencies
+
+# Run func once per batch, timing every batch
+def measure_batches(func, batches, size=len):
+    latencies = []
+    count = 0
+    for batch in batches:
+        start = time.perf_counter()
+        func(batch)
+        latencies.append(time.perf_counter() - start)
+        count += size(batch)
+    return count, sum(latencies), latencies
+
+def percentiles(latencies):
+    if not latencies:
+        return None
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return {'p50': p50, 'p90': p90, 'p99': p99, 'max': max(latencies) * 1000}
+
+# Print one result line and return it as a record for the JSON output
+def report(name, count, seconds, latencies=None, unit='message'):
+    result = {'stage': name, 'messages': count, 'seconds': seconds, 'msgs_per_s': count / seconds if seconds else None,
+              'latency_unit': unit, 'latency_ms': percentiles(latencies)}
+    line = f"  {name:<28} {seconds:8.3f}s  {count / seconds:12,.0f} msgs/s"
+    if result['latency_ms']:
+        latency = result['latency_ms']
+        line += f"  per {unit}: p50 {latency['p50']:.3f}ms  p90 {latency['p90']:.3f}ms  p99 {latency['p99']:.3f}ms"
+    print(line)
+    return result
+
+# Each extracted link is cleaned again by add_channel, get_affiliation, mark_as_joined and mark_as_processed
+def legacy_crawl_path(text):
+    for link in re.findall(r't\.me/(?:joinchat/)?[a-zA-Z0-9_-]+', text):
+        for _ in range(4):
+            legacy_clean_link(link)
+
+def crawl_path(text):
+    for link in telehunting.extract_channel_links(text):
+        for _ in range(4):
+            telehunting.clean_link(link)
+
+def bench_links(args):
+    messages = synthetic_messages(args.messages)
+    print(f"Link extraction over {len(messages):,} messages")
+    return [
+        report('legacy findall + clean_link', len(messages), timed(legacy_extract_and_clean, messages)),
+        report('extract_channel_links', len(messages), timed(telehunting.extract_channel_links, messages)),
+        report('legacy crawl path', len(messages), timed(legacy_crawl_path, messages)),
+        report('crawl path (memoized)', len(messages), timed(crawl_path, messages)),
+    ]
+
+def bench_sentiment(args):
+    messages = synthetic_messages(args.messages, repost_rate=args.repost_rate)
+    print(f"Sentiment scoring over {len(messages):,} messages ({args.repost_rate:.0%} reposts)")
+    analyzer = telehunting.CybersecuritySentimentAnalyzer()
+    series = telehunting.pd.Series(messages)
+    results = [report('per-row Series.apply', len(messages), timed(series.apply, [analyzer.polarity_scores]))]
+    analyzer = telehunting.CybersecuritySentimentAnalyzer()
+    results.append(report('score_batch (cold cache)', len(messages), timed(analyzer.score_batch, [messages])))
+    results.append(report('score_batch (warm cache)', len(messages), timed(analyzer.score_batch, [messages])))
+    return results
+
+# Watchlist of distinct made-up terms, a few of them real words so messages actually hit
+def synthetic_keywords(count, seed=0):
+    rng = random.Random(seed)
+    keywords = set(WORDS[:5])
+    while len(keywords) < count:
+        keywords.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))))
+    return sorted(keywords)
+
+def bench_keywords(args):
+    messages = synthetic_messages(args.messages)
+    keywords = synthetic_keywords(args.keywords)
+    print(f"Keyword matching, {len(keywords):,} keywords over {len(messages):,} messages")
+    start = time.perf_counter()
+    matcher = telehunting.KeywordMatcher(keywords)
+    print(f"  {'automaton build':<28} {time.perf_counter() - start:8.3f}s")
+    # Per-keyword scans are far too slow for the whole corpus, time them on a sample
+    sample = messages[:max(1, len(messages) // 100)]
+    lowered = [keyword.lower() for keyword in keywords]
+    return [
+        report('per-keyword `in` (1% sample)', len(sample), timed(lambda text: [k for k in lowered if k in text.lower()], sample)),
+        report('KeywordMatcher.match', len(messages), timed(matcher.match, messages)),
+    ]
+
+def bench_extract(args):
+    total = corpus_size(args)
+    print(f"Link extraction over {total:,} messages")
+    return [report('extract_channel_links', *measure(telehunting.extract_channel_links, corpus_chunks(total), total))]
+
+def bench_score(args):
+    total = corpus_size(args)
+    print(f"Sentiment scoring over {total:,} messages ({args.repost_rate:.0%} reposts)")
+    analyzer = telehunting.CybersecuritySentimentAnalyzer()
+    results = [report('polarity_scores', *measure(analyzer.polarity_scores, corpus_chunks(total, repost_rate=args.repost_rate), total))]
+    batches = corpus_chunks(total, repost_rate=args.repost_rate, chunk_size=args.batch_size)
+    results.append(report('score_batch', *measure_batches(analyzer.score_batch, batches), unit='batch'))
+    return results
+
+# The obvious extractor as a baseline: every message refanged and searched once per indicator type
+LEGACY_IOC_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'\b(?:https?|ftp)://[^\s<>"]+',
+    r'\b[\w.+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}\b',
+    r'\b(?:\d{1,3}\.){3}\d{1,3}\b',
+    r'\b(?:[0-9a-f]{1,4}:){2,7}[0-9a-f]{1,4}\b',
+    r'\b[0-9a-f]{64}\b',
+    r'\b[0-9a-f]{40}\b',
+    r'\b[0-9a-f]{32}\b',
+    r'\bCVE-\d{4}-\d{4,7}\b',
+    r'\b0x[0-9a-f]{40}\b',
+    r'\b(?:[13][a-km-zA-HJ-NP-Z1-9]{25,34}|bc1[a-z0-9]{39,59})\b',
+    r'\b(?:[a-z0-9-]+\.)+[a-z]{2,}\b',
+)]
+
+def legacy_extract_iocs(text):
+    text = telehunting.refang(text)
+    return [match for pattern in LEGACY_IOC_PATTERNS for match in pattern.findall(text)]
+
+# Pages of history where ioc_rate of the messages carry an indicator from a shared pool, a third of them defanged
+def ioc_corpus_pages(total, ioc_rate, seed=0, page_size=100):
+    import replay
+    rng = random.Random(seed)
+    indicators = [replay.synthetic_indicator(rng) for _ in range(10000)]
+    for page in corpus_chunks(total, seed, chunk_size=page_size):
+        for index, text in enumerate(page):
+            if rng.random() < ioc_rate:
+                indicator = rng.choice(indicators)
+                page[index] = f"{text} {replay.defang(indicator) if rng.random() < 0.3 else indicator}"
+        yield page
+
+class BenchMessage:
+    __slots__ = ('raw_text', 'text', 'date')
+
+    def __init__(self, text, date):
+        self.raw_text = self.text = text
+        self.date = date
+
+def bench_iocs(args):
+    total = corpus_size(args)
+    print(f"Indicator extraction over {total:,} messages ({args.ioc_rate:.0%} with an indicator)")
+    # The per-type baseline is far slower, time it on a sample
+    sample = max(1, total // 10)
+    results = [
+        report('per-type regexes (10% sample)', *measure(legacy_extract_iocs, ioc_corpus_pages(sample, args.ioc_rate), sample)),
+        report('extract_iocs per message', *measure(lambda text: telehunting.extract_iocs([text]), ioc_corpus_pages(total, args.ioc_rate), total)),
+        report('extract_iocs per page', *measure_batches(telehunting.extract_iocs, ioc_corpus_pages(total, args.ioc_rate)), unit='page'),
+    ]
+    # The whole stage as the crawl runs it: message objects in, sightings written to the state database
+    date = telehunting.datetime.now()
+    pages = ([BenchMessage(text, date) for text in page] for page in ioc_corpus_pages(total, args.ioc_rate))
+    with tempfile.TemporaryDirectory() as state_dir:
+        state = telehunting.open_state_db(os.path.join(state_dir, 'state.db'))
+        extractor = telehunting.IocExtractor(telehunting.IocStore(state))
+        results.append(report('IocExtractor.add + IocStore', *measure_batches(lambda page: extractor.add(page, 'bench'), pages), unit='page'))
+        state.commit()
+        state.close()
+    for result in results[1:]:
+        print(f"  {result['stage']:<28} {result['msgs_per_s'] * 60 / 1e6:8.2f}M msgs/min")
+    return results
+
+# (df, scores) batches shaped like the ones BatchProcessor writes, with random scores so only
+# the stage under test is timed
+def scored_batches(total, batch_size, seed=0):
+    rng = np.random.default_rng(seed)
+    compound = telehunting.SENTIMENT_FIELDS.index('compound')
+    date = telehunting.datetime.now()
+    for chunk in corpus_chunks(total, seed, chunk_size=batch_size):
+        scores = rng.random((len(chunk), len(telehunting.SENTIMENT_FIELDS)))
+        scores[:, compound] = scores[:, compound] * 2 - 1
+        batch = telehunting.RecordBatch()
+        batch.extend([telehunting.MessageRecord(index, date, text, []) for index, text in enumerate(chunk)], 'bench', 'Initial Config', 1)
+        df = batch.to_dataframe()
+        df['Sentiment'] = [dict(zip(telehunting.SENTIMENT_FIELDS, row)) for row in scores.tolist()]
+        df['Compound_Sentiment'] = scores[:, compound]
+        yield df, scores
+
+def batch_size_of(batch):
+    return len(batch[0])
+
+def has_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+def bench_save(args):
+    total = corpus_size(args)
+    print(f"Batch saving over {total:,} messages")
+    results = []
+    for output_format in ['csv'] + (['parquet'] if has_pyarrow() else []):
+        with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(open(os.devnull, 'w')):
+            processor = telehunting.BatchProcessor(args.batch_size, cybersecurity_sia=object(), sink=telehunting.create_sink(output_format, output_dir))
+            measured = measure_batches(lambda batch: processor.save_batch(*batch), scored_batches(total, args.batch_size), batch_size_of)
+            processor.sink.close()
+        results.append(report(f'save_batch ({output_format})', *measured, unit='batch'))
+    return results
+
+def bench_report(args):
+    total = corpus_size(args)
+    print(f"Sentiment report over {total:,} messages")
+    sentiment_report = telehunting.SentimentReport()
+    measured = measure_batches(lambda batch: sentiment_report.update_from_dataframe(batch[0]), scored_batches(total, args.batch_size), batch_size_of)
+    results = [report('SentimentReport.update', *measured, unit='batch')]
+    with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(open(os.devnull, 'w')):
+        start = time.perf_counter()
+        sentiment_report.write(os.path.join(output_dir, 'sentiment_report.txt'))
+        seconds = time.perf_counter() - start
+    print(f"  {'SentimentReport.write':<28} {seconds:8.3f}s")
+    results.append({'stage': 'SentimentReport.write', 'messages': total, 'seconds': seconds, 'msgs_per_s': None, 'latency_unit': 'report', 'latency_ms': None})
+    return results
+
+# A full crawl of a synthetic replayed corpus with every channel seeded, so it covers the whole corpus
+def bench_crawl(args):
+    import replay
+    total = corpus_size(args)
+    channels = max(1, total // args.channel_messages)
+    data = replay.ReplayData.synthetic(channels, args.channel_messages, link_rate=0.1)
+    clients = [replay.ReplayClient(data, account, latency=args.latency) for account in range(args.accounts)]
+    accounts = [telehunting.Account(f"bench{account}", client) for account, client in enumerate(clients)]
+    config = {'initial_channel_links': list(data.usernames), 'message_keywords': WORDS[:5], 'batch_size': args.batch_size}
+    print(f"Replayed crawl of {channels:,} channels (~{total:,} messages), {args.accounts} account(s)")
+
+    # process_channels looks process_channel up at call time, so a timing wrapper sees every channel
+    channel_latencies = []
+    process_channel = telehunting.process_channel
+    async def timed_process_channel(*channel_args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await process_channel(*channel_args, **kwargs)
+        finally:
+            channel_latencies.append(time.perf_counter() - start)
+
+    telehunting.process_channel = timed_process_channel
+    try:
+        # The final sentiment report goes to the working directory, so the crawl runs inside the temporary one
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(open(os.devnull, 'w')):
+            os.chdir(output_dir)
+            try:
+                start = time.perf_counter()
+                asyncio.run(telehunting.run_scraper(config, args.channel_messages * 10, 1, args.concurrency, 10 ** 6, os.path.join(output_dir, 'state.db'),
+                                                    sentiment_workers=args.sentiment_workers, sink=telehunting.create_sink('csv', output_dir), accounts=accounts))
+                seconds = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+    finally:
+        telehunting.process_channel = process_channel
+    messages = sum(client.calls['messages'] for client in clients)
+    result = report('crawl (replayed)', messages, seconds, channel_latencies, unit='channel')
+    # Largest process this one started, in practice a sentiment worker
+    result['peak_rss_largest_child_mb'] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return [result]
+
+# Fresh interpreter launches, as short cron and monitor runs pay for them. The cold lexicon case
+# gets an empty cache directory each time, so it parses and merges the VADER lexicon again.
+STARTUP_COMMANDS = [
+    ('import telehunting', ['-c', 'import telehunting'], False),
+    ('telehunting.py --help', ['telehunting.py', '--help'], False),
+    ('analyzer (cached lexicon)', ['-c', 'import telehunting; telehunting.get_sentiment_analyzer()'], False),
+    ('analyzer (cold lexicon)', ['-c', 'import telehunting; telehunting.get_sentiment_analyzer()'], True),
+]
+
+def bench_startup(args):
+    root = os.path.dirname(os.path.abspath(__file__))
+    print(f"Startup over {args.launches} launches each")
+    subprocess.run([sys.executable, '-c', 'import telehunting; telehunting.get_sentiment_analyzer()'], cwd=root, check=True)
+    results = []
+    for name, command, cold in STARTUP_COMMANDS:
+        latencies = []
+        for _ in range(args.launches):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                env = dict(os.environ, XDG_CACHE_HOME=cache_dir) if cold else None
+                start = time.perf_counter()
+                subprocess.run([sys.executable] + command, cwd=root, env=env, check=True, stdout=subprocess.DEVNULL)
+                latencies.append(time.perf_counter() - start)
+        latency = percentiles(latencies)
+        print(f"  {name:<28} p50 {latency['p50']:8.1f}ms  p90 {latency['p90']:8.1f}ms  max {latency['max']:8.1f}ms")
+        results.append({'stage': name, 'messages': None, 'seconds': sum(latencies), 'msgs_per_s': None, 'latency_unit': 'launch', 'latency_ms': latency})
+    return results
+
+BENCHMARKS = {
+    'links': bench_links,
+    'sentiment': bench_sentiment,
+    'keywords': bench_keywords,
+    'extract': bench_extract,
+    'score': bench_score,
+    'iocs': bench_iocs,
+    'save': bench_save,
+    'report': bench_report,
+    'crawl': bench_crawl,
+    'startup': bench_startup,
+}
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss / 1024
+
+# Each benchmark runs in a fresh process so the peak RSS it reports is its own
+def run_isolated(connection, name, args):
+    results = BENCHMARKS[name](args)
+    connection.send({'benchmark': name, 'peak_rss_mb': peak_rss_mb(), 'results': results})
+    connection.close()
+
+def run_benchmark(name, args):
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_isolated, args=(sender, name, args))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None:
+        print(f"  {name} failed with exit code {process.exitcode}")
+        return {'benchmark': name, 'error': f"exit code {process.exitcode}"}
+    print(f"  peak RSS {result['peak_rss_mb']:.0f} MB")
+    return result
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return revision.stdout.strip() or None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Telehunting benchmarks')
+    parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--messages', type=int, default=200000, help='Size of the synthetic message corpus')
+    parser.add_argument('--scale', choices=list(SCALES), help='Corpus size for the extract, score, iocs, save, report and crawl benchmarks, instead of --messages')
+    parser.add_argument('--repost-rate', type=float, default=0.3, help='Share of messages that repeat an earlier message verbatim')
+    parser.add_argument('--ioc-rate', type=float, default=0.05, help='Share of messages carrying an indicator of compromise in the iocs benchmark')
+    parser.add_argument('--keywords', type=int, default=10000, help='Size of the synthetic keyword watchlist')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Messages per batch for the batch stages and the crawl')
+    parser.add_argument('--channel-messages', type=int, default=1000, help='Mean messages per channel in the replayed crawl')
+    parser.add_argument('--accounts', type=int, default=1, help='Replay accounts crawling side by side')
+    parser.add_argument('--concurrency', type=int, default=4, help='Crawl workers per account')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated seconds per Telegram request in the replayed crawl')
+    parser.add_argument('--sentiment-workers', type=int, default=max(1, multiprocessing.cpu_count() - 1), help='Sentiment processes in the replayed crawl')
+    parser.add_argument('--launches', type=int, default=10, help='Interpreter launches per case in the startup benchmark')
+    parser.add_argument('--json', type=str, help='Write the results to this JSON file so runs can be compared')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    runs = [run_benchmark(name, args) for name in args.benchmarks or BENCHMARKS]
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'started_at': telehunting.datetime.now().isoformat(),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'cpu_count': multiprocessing.cpu_count(),
+                'arguments': vars(args),
+                'benchmarks': runs,
+            }, f, indent=4)
+        print(f"Results written to {args.json}")
@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import bisect
+import contextlib
+import itertools
+import json
+import os
+import random
+import resource
+import string
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from telethon.errors import FloodWaitError, ChannelInvalidError, ChannelsTooMuchError, UsernameNotOccupiedError, InviteHashExpiredError, UserNotParticipantError
+from telethon.tl.functions.channels import JoinChannelRequest, LeaveChannelRequest
+from telethon.tl.types import Channel, ChatPhotoEmpty, InputPeerChannel, Message, PeerChannel, PeerUser
+
+import telehunting
+
+WORDS = ['hack', 'carding', 'malware', 'exploit', 'cracking', 'free', 'logs', 'combo', 'fresh', 'update',
+         'channel', 'join', 'new', 'tool', 'crypter', 'stealer', 'botnet', 'vpn', 'cheap', 'price']
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+TLDS = ['com', 'net', 'org', 'ru', 'io', 'xyz', 'top', 'cn']
+
+# A made-up indicator of compromise: URL, domain, IPv4, e-mail, MD5, SHA256, CVE id or Ethereum address
+def synthetic_indicator(rng):
+    name = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12)))
+    domain = f"{name}.{rng.choice(TLDS)}"
+    return rng.choice([
+        f"https://{domain}/{name}.exe",
+        domain,
+        '.'.join(str(rng.randrange(1, 255)) for _ in range(4)),
+        f"{name[:4]}@{domain}",
+        f"{rng.getrandbits(128):032x}",
+        f"{rng.getrandbits(256):064x}",
+        f"CVE-20{rng.randint(10, 25)}-{rng.randint(1000, 49999)}",
+        f"0x{rng.getrandbits(160):040x}",
+    ])
+
+# Threat intel posts often defang their indicators so they can't be clicked
+def defang(indicator):
+    return indicator.replace('http', 'hxxp').replace('.', '[.]').replace('@', '[at]')
+
+# A channel as the replay client serves it. Recorded channels keep their messages, synthetic ones
+# generate message n on demand from the seed so a 10M message corpus costs no memory.
+class ReplayChannel:
+    __slots__ = ('id', 'username', 'title', 'ids', 'messages', 'links')
+
+    def __init__(self, id, username, title, ids, messages=None, links=None):
+        self.id = id
+        self.username = username
+        self.title = title
+        self.ids = ids  # ascending message ids, a range for synthetic channels
+        self.messages = messages  # id -> (date, text, sender_id) for recorded channels
+        self.links = links or []  # usernames synthetic messages link to
+
+# Channels and histories shared by every replay client, loaded from a fixture directory or generated
+class ReplayData:
+    def __init__(self, channels, seed=0, link_rate=0.0, ioc_rate=0.0):
+        self.channels = {channel.id: channel for channel in channels}
+        self.usernames = {channel.username.lower(): channel for channel in channels if channel.username}
+        self.seed = seed
+        self.link_rate = link_rate
+        self.ioc_rate = ioc_rate
+        # Indicators come from a shared pool so the same ones turn up in several channels
+        pool = random.Random(f"{seed}:iocs")
+        self.indicators = [synthetic_indicator(pool) for _ in range(1000)] if ioc_rate else []
+
+    # Fixture layout: channels.json with [{"id", "username", "title"}] and messages/<id>.jsonl
+    # holding one {"id", "date", "text", "sender_id"} object per line
+    @classmethod
+    def from_fixture(cls, path):
+        with open(os.path.join(path, 'channels.json')) as f:
+            entries = json.load(f)
+        channels = []
+        for entry in entries:
+            messages = {}
+            history = os.path.join(path, 'messages', f"{entry['id']}.jsonl")
+            if os.path.exists(history):
+                with open(history) as f:
+                    for line in f:
+                        record = json.loads(line)
+                        date = datetime.fromisoformat(record['date']) if record.get('date') else None
+                        messages[record['id']] = (date, record.get('text') or '', record.get('sender_id'))
+            channels.append(ReplayChannel(entry['id'], entry.get('username'), entry.get('title'), sorted(messages), messages))
+        return cls(channels)
+
+    # A link graph where a few channels are linked from many others (Zipf popularity) and a share
+    # of the links point at usernames that do not exist
+    @classmethod
+    def synthetic(cls, channels=200, messages=500, links_per_channel=8, link_rate=0.1, dead_link_rate=0.05, seed=0, ioc_rate=0.0):
+        rng = random.Random(seed)
+        usernames = [f"replay{index:06d}" for index in range(channels)]
+        weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(channels)))
+        result = []
+        for index, username in enumerate(usernames):
+            links = [usernames[target] for target in rng.choices(range(channels), cum_weights=weights, k=links_per_channel) if target != index]
+            links += [f"gone{rng.randrange(10 ** 6):06d}" for _ in range(links_per_channel) if rng.random() < dead_link_rate]
+            count = max(0, int(rng.expovariate(1 / messages))) if messages else 0
+            result.append(ReplayChannel(1000000 + index, username, username.upper(), range(1, count + 1), links=links))
+        return cls(result, seed, link_rate, ioc_rate)
+
+    def message(self, channel, message_id):
+        if channel.messages is not None:
+            return channel.messages[message_id]
+        rng = random.Random(f"{self.seed}:{channel.id}:{message_id}")
+        words = rng.choices(WORDS, k=rng.randint(5, 40))
+        if channel.links and rng.random() < self.link_rate:
+            words.insert(rng.randrange(len(words)), f"https://t.me/{rng.choice(channel.links)}")
+        if self.ioc_rate and rng.random() < self.ioc_rate:
+            indicator = rng.choice(self.indicators)
+            words.insert(rng.randrange(len(words)), defang(indicator) if rng.random() < 0.3 else indicator)
+        return EPOCH + timedelta(minutes=message_id), ' '.join(words), rng.randrange(1, 10 ** 6)
+
+    def save(self, path, limit=None):
+        os.makedirs(os.path.join(path, 'messages'), exist_ok=True)
+        with open(os.path.join(path, 'channels.json'), 'w') as f:
+            json.dump([{'id': channel.id, 'username': channel.username, 'title': channel.title} for channel in self.channels.values()], f, indent=4)
+        for channel in self.channels.values():
+            with open(os.path.join(path, 'messages', f"{channel.id}.jsonl"), 'w') as f:
+                for message_id in channel.ids[-limit:] if limit else channel.ids:
+                    date, text, sender_id = self.message(channel, message_id)
+                    f.write(json.dumps({'id': message_id, 'date': date.isoformat() if date else None, 'text': text, 'sender_id': sender_id}) + '\n')
+
+# Stand-in for TelegramClient covering the calls the crawler makes, with optional latency and
+# FloodWaitError injection. Flood waits are drawn per call site and call count, so a run is reproducible.
+class ReplayClient:
+    def __init__(self, data, account=0, latency=0.0, flood_rate=0.0, flood_seconds=1, seed=0, membership_limit=500):
+        self.data = data
+        self.membership_limit = membership_limit
+        self.members = set()
+        self.account = account
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.seed = seed
+        self.flood_sleep_threshold = 60
+        self.parse_mode = None
+        self.calls = Counter()
+        self.call_sites = Counter()
+        self.handlers = []
+
+    async def start(self, phone=None):
+        return self
+
+    async def disconnect(self):
+        pass
+
+    # Takeout sessions only change Telegram's limits, history comes back the same
+    @contextlib.asynccontextmanager
+    async def takeout(self, finalize=True, **kwargs):
+        self.calls['takeout'] += 1
+        yield self
+
+    # Access hashes differ per account, as they do on Telegram
+    def access_hash(self, channel):
+        return (channel.id * 1000003 + self.account * 7919) & 0x7fffffffffffffff
+
+    async def request(self, kind, key):
+        self.calls[kind] += 1
+        self.call_sites[kind, key] += 1
+        if self.flood_rate and random.Random(f"{self.seed}:{self.account}:{kind}:{key}:{self.call_sites[kind, key]}").random() < self.flood_rate:
+            self.calls['flood_wait'] += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def channel_for(self, peer):
+        if isinstance(peer, InputPeerChannel):
+            channel = self.data.channels.get(peer.channel_id)
+            if channel is None or peer.access_hash != self.access_hash(channel):
+                raise ChannelInvalidError(request=None)
+            return channel
+        return self.data.channels[peer.id]
+
+    def entity(self, channel):
+        return Channel(id=channel.id, title=channel.title or '', photo=ChatPhotoEmpty(), date=EPOCH,
+                       username=channel.username, access_hash=self.access_hash(channel), broadcast=True)
+
+    async def get_entity(self, key):
+        if isinstance(key, InputPeerChannel):
+            await self.request('get_entity', key.channel_id)
+            return self.entity(self.channel_for(key))
+        name = str(key).split('t.me/')[-1].lstrip('@').lower()
+        await self.request('get_entity', name)
+        if name.startswith(('joinchat/', '+')):
+            raise InviteHashExpiredError(request=None)
+        channel = self.data.usernames.get(name)
+        if channel is None:
+            raise UsernameNotOccupiedError(request=None)
+        return self.entity(channel)
+
+    async def __call__(self, request):
+        if isinstance(request, JoinChannelRequest):
+            await self.request('join', request.channel.channel_id)
+            channel = self.channel_for(request.channel)
+            if channel.id not in self.members and len(self.members) >= self.membership_limit:
+                raise ChannelsTooMuchError(request=None)
+            self.members.add(channel.id)
+        elif isinstance(request, LeaveChannelRequest):
+            await self.request('leave', request.channel.channel_id)
+            channel = self.channel_for(request.channel)
+            if channel.id not in self.members:
+                raise UserNotParticipantError(request=None)
+            self.members.discard(channel.id)
+        else:
+            await self.request(type(request).__name__, None)
+
+    def message(self, channel, message_id):
+        date, text, sender_id = self.data.message(channel, message_id)
+        message = Message(id=message_id, peer_id=PeerChannel(channel.id), date=date, message=text,
+                          from_id=PeerUser(sender_id) if sender_id else None)
+        message._client = self
+        return message
+
+    # Same paging as Telethon: newest first below offset_id, or oldest first above min_id with reverse
+    async def iter_messages(self, entity, limit=None, offset_id=0, min_id=0, max_id=0, reverse=False, wait_time=None, **kwargs):
+        channel = self.channel_for(entity)
+        # Telethon sleeps a second between pages of long histories unless told otherwise
+        if wait_time is None:
+            wait_time = 1 if limit is None or limit > 3000 else 0
+        ids = channel.ids
+        low = bisect.bisect_right(ids, min_id)
+        high = bisect.bisect_left(ids, offset_id) if offset_id else len(ids)
+        if max_id:
+            high = min(high, bisect.bisect_left(ids, max_id))
+        selected = ids[low:high] if reverse else ids[low:high][::-1]
+        if limit is not None:
+            selected = selected[:limit]
+        for index, message_id in enumerate(selected):
+            if index % 100 == 0:
+                if index and wait_time:
+                    await asyncio.sleep(wait_time)
+                await self.request('history', (channel.id, message_id))
+            self.calls['messages'] += 1
+            yield self.message(channel, message_id)
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((callback, event))
+
+    def remove_event_handler(self, callback, event=None):
+        self.handlers = [(registered, filter) for registered, filter in self.handlers if registered is not callback]
+
+    # Deliver a new message to the registered update handlers, as monitor mode would receive it
+    async def push_message(self, username, text, sender_id=1):
+        channel = self.data.usernames[username.lower()]
+        message_id = (channel.ids[-1] if len(channel.ids) else 0) + 1
+        if channel.messages is None:
+            channel.messages = {}
+        channel.messages[message_id] = (datetime.now(timezone.utc), text, sender_id)
+        channel.ids = list(channel.ids) + [message_id]
+        message = self.message(channel, message_id)
+        event = type('ReplayEvent', (), {'message': message})()
+        for callback, _ in self.handlers:
+            await callback(event)
+
+# Record channel metadata and recent history from a live client into a fixture directory
+async def record_fixture(client, links, path, limit=1000):
+    os.makedirs(os.path.join(path, 'messages'), exist_ok=True)
+    channels = []
+    for link in links:
+        entity = await client.get_entity(telehunting.clean_link(link))
+        channels.append({'id': entity.id, 'username': getattr(entity, 'username', None), 'title': getattr(entity, 'title', None)})
+        with open(os.path.join(path, 'messages', f"{entity.id}.jsonl"), 'w') as f:
+            async for message in client.iter_messages(entity, limit=limit):
+                f.write(json.dumps({'id': message.id, 'date': message.date.isoformat() if message.date else None,
+                                    'text': message.raw_text, 'sender_id': message.sender_id}) + '\n')
+    with open(os.path.join(path, 'channels.json'), 'w') as f:
+        json.dump(channels, f, indent=4)
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Crawl a replayed corpus end to end and report throughput, request counts and peak memory
+def run_replay(args, data):
+    os.makedirs(args.output_dir, exist_ok=True)
+    state_db = os.path.join(args.output_dir, 'replay_state.db')
+    index_db = os.path.join(args.output_dir, 'replay_index.db')
+    for path in (state_db, index_db):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    clients = [ReplayClient(data, account, args.latency, args.flood_rate, args.flood_seconds, args.seed, args.membership_limit) for account in range(args.accounts)]
+    accounts = [telehunting.Account(f"replay{account}", replay_client) for account, replay_client in enumerate(clients)]
+    seeds = [channel.username for channel in itertools.islice(data.channels.values(), args.seeds)]
+    config = {'initial_channel_links': seeds, 'message_keywords': WORDS[:5], 'batch_size': args.batch_size}
+    sink = telehunting.create_sink(args.output_format, args.output_dir)
+    dedup = None if args.no_dedup else telehunting.MessageDeduplicator()
+    iocs = None if args.no_iocs else telehunting.IocExtractor()
+    index = None if args.no_index else telehunting.SearchIndex(index_db)
+
+    start = time.perf_counter()
+    asyncio.run(telehunting.run_scraper(config, args.message_depth, args.channel_depth, args.concurrency, args.requests_per_second,
+                                        state_db, sentiment_workers=args.sentiment_workers, sink=sink, accounts=accounts, dedup=dedup, index=index,
+                                        join_mode=args.join_mode, membership_limit=args.membership_limit, takeout=args.takeout, iocs=iocs))
+    elapsed = time.perf_counter() - start
+
+    calls = sum((replay_client.calls for replay_client in clients), Counter())
+    messages = calls.pop('messages', 0)
+    telehunting.print_header("Replay Summary")
+    telehunting.print_detail(f"  elapsed:       {elapsed:.2f}s")
+    telehunting.print_detail(f"  messages:      {messages:,} ({messages / elapsed:,.0f} msgs/s)")
+    telehunting.print_detail(f"  requests:      {', '.join(f'{kind} {count}' for kind, count in sorted(calls.items()))}")
+    telehunting.print_detail(f"  peak RSS:      {peak_rss_mb():.0f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Crawl a recorded or synthetic Telegram corpus offline')
+    parser.add_argument('--fixture', type=str, help='Fixture directory to replay (default: generate a synthetic corpus)')
+    parser.add_argument('--save-fixture', type=str, help='Write the synthetic corpus to this fixture directory and exit')
+    parser.add_argument('--channels', type=int, default=200, help='Synthetic channels')
+    parser.add_argument('--messages', type=int, default=500, help='Mean synthetic messages per channel')
+    parser.add_argument('--links-per-channel', type=int, default=8, help='Channels each synthetic channel links to')
+    parser.add_argument('--link-rate', type=float, default=0.1, help='Share of synthetic messages carrying a link')
+    parser.add_argument('--ioc-rate', type=float, default=0.0, help='Share of synthetic messages carrying an indicator of compromise, some of them defanged')
+    parser.add_argument('--dead-link-rate', type=float, default=0.05, help='Share of links pointing at usernames that do not exist')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic corpus and injected flood waits')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request and history page')
+    parser.add_argument('--flood-rate', type=float, default=0.0, help='Probability that a request raises FloodWaitError')
+    parser.add_argument('--flood-seconds', type=int, default=1, help='Length of injected flood waits')
+    parser.add_argument('--accounts', type=int, default=1, help='Replay clients crawling side by side')
+    parser.add_argument('--seeds', type=int, default=5, help='Channels the crawl starts from')
+    parser.add_argument('--message-depth', type=int, default=1000)
+    parser.add_argument('--channel-depth', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests-per-second', type=float, default=1000.0)
+    parser.add_argument('--sentiment-workers', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--no-dedup', action='store_true')
+    parser.add_argument('--takeout', action='store_true')
+    parser.add_argument('--join-mode', choices=['auto', 'always', 'never'], default='auto')
+    parser.add_argument('--membership-limit', type=int, default=500, help='Channels each replay account may join before joins fail with ChannelsTooMuchError')
+    parser.add_argument('--no-index', action='store_true')
+    parser.add_argument('--no-iocs', action='store_true')
+    parser.add_argument('--output-format', choices=['csv', 'parquet', 'arrow'], default='csv')
+    parser.add_argument('--output-dir', type=str, default='replay_output', help='Directory for the crawl output and its state database')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO')
+    args = parser.parse_args()
+    telehunting.setup_logging(args.log_level)
+
+    if args.fixture:
+        data = ReplayData.from_fixture(args.fixture)
+    else:
+        data = ReplayData.synthetic(args.channels, args.messages, args.links_per_channel, args.link_rate, args.dead_link_rate, args.seed, args.ioc_rate)
+    if args.save_fixture:
+        data.save(args.save_fixture)
+        telehunting.print_success(f"Saved {len(data.channels)} channels to {args.save_fixture}")
+    else:
+        run_replay(args, data)
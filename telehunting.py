@@ -1,47 +1,160 @@
 import asyncio
+import atexit
+import bisect
+import hashlib
+import heapq
+import ipaddress
+import itertools
+import importlib
+import math
+import pickle
 import re
-import pandas as pd
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-from telethon.sync import TelegramClient
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.errors import FloodWaitError, ChannelPrivateError
-from telethon.tl.types import Channel, User, Channel, Chat
-import multiprocessing
-from functools import partial
+import functools
 import argparse
+from array import array
 import json
-import random
+import logging
+import queue
 import signal
 import os
+import sqlite3
+import sys
+import time
+import unicodedata
+import zlib
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict, deque
 from datetime import datetime
 from colorama import init, Fore, Back, Style
 
 init(autoreset=True)
 
+# Stands in for a module that is slow to import and replaces itself with the real one on first use
+class LazyModule:
+    def __init__(self, name, alias):
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return getattr(module, attribute)
+
+# Together these take most of a second to import, `search`, `--help` and the sentiment-free
+# parts of a crawl shouldn't pay for the ones they never touch
+np = LazyModule('numpy', 'np')
+pd = LazyModule('pandas', 'pd')
+events = LazyModule('telethon.events', 'events')
+utils = LazyModule('telethon.utils', 'utils')
+errors = LazyModule('telethon.errors', 'errors')
+functions = LazyModule('telethon.tl.functions', 'functions')
+types = LazyModule('telethon.tl.types', 'types')
+
 PURPLE_BLUE = '\033[38;2;100;100;255m'
 LIGHT_PURPLE = '\033[38;2;200;180;255m'
 BOLD_WHITE = '\033[1;37m'
 
-def print_info(message):
-    print(f"{PURPLE_BLUE}ℹ {BOLD_WHITE}{message}")
-
-def print_success(message):
-    print(f"{LIGHT_PURPLE}✔ {BOLD_WHITE}{message}")
-
-def print_warning(message):
-    print(f"{Fore.YELLOW}{Style.BRIGHT}⚠ {BOLD_WHITE}{message}")
+# Everything the crawler reports goes through this logger. setup_logging puts a queue in front of
+# the console and the optional JSON-lines file, so a slow terminal never stalls the event loop.
+logger = logging.getLogger('telehunting')
+log_listener = None
+
+ANSI_PATTERN = re.compile(r'\x1b\[[0-9;]*m')
+
+LOG_STYLES = {
+    'debug': (f"{Style.DIM}· ", "· "),
+    'info': (f"{PURPLE_BLUE}ℹ {BOLD_WHITE}", "ℹ "),
+    'success': (f"{LIGHT_PURPLE}✔ {BOLD_WHITE}", "✔ "),
+    'warning': (f"{Fore.YELLOW}{Style.BRIGHT}⚠ {BOLD_WHITE}", "⚠ "),
+    'error': (f"{Fore.RED}✘ ", "✘ "),
+    'detail': ("", ""),
+}
+
+# The colored symbols the print_* helpers always had, without escape codes when not on a terminal
+class ConsoleFormatter(logging.Formatter):
+    def __init__(self, color=True):
+        super().__init__()
+        self.color = color
+
+    def format(self, record):
+        kind = getattr(record, 'kind', record.levelname.lower())
+        message = record.getMessage()
+        if kind in ('header', 'subheader'):
+            color = PURPLE_BLUE if kind == 'header' else LIGHT_PURPLE
+            lines = [f"\n{color}{Style.BRIGHT}{message}", f"{color}{'-' * len(message)}{Style.RESET_ALL}"]
+        else:
+            color_prefix, plain_prefix = LOG_STYLES.get(kind, LOG_STYLES['info'])
+            lines = [(color_prefix if self.color else plain_prefix) + message]
+        text = '\n'.join(lines)
+        return text if self.color else ANSI_PATTERN.sub('', text)
+
+# One JSON object per line, structured fields passed as extra={'fields': {...}} become keys
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname.lower(),
+            'kind': getattr(record, 'kind', record.levelname.lower()),
+            'message': ANSI_PATTERN.sub('', record.getMessage()),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        return json.dumps(entry, default=str)
 
-def print_error(message):
-    print(f"{Fore.RED}✘ {message}")
+def setup_logging(level='INFO', log_file=None, color=None):
+    global log_listener
+    if log_listener:
+        stop_logging()
+    else:
+        atexit.register(stop_logging)
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(ConsoleFormatter(sys.stdout.isatty() if color is None else color))
+    handlers = [console]
+    if log_file:
+        json_lines = logging.FileHandler(log_file, encoding='utf-8')
+        json_lines.setFormatter(JsonLinesFormatter())
+        handlers.append(json_lines)
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, *handlers)
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.setLevel(level)
+    logger.propagate = False
+    log_listener.start()
+
+# Flush the queued records and close the handlers, setup_logging can be called again afterwards
+def stop_logging():
+    global log_listener
+    if log_listener:
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+def print_debug(message, **fields):
+    logger.debug(message, extra={'kind': 'debug', 'fields': fields})
+
+def print_info(message, **fields):
+    logger.info(message, extra={'kind': 'info', 'fields': fields})
+
+def print_success(message, **fields):
+    logger.info(message, extra={'kind': 'success', 'fields': fields})
+
+def print_warning(message, **fields):
+    logger.warning(message, extra={'kind': 'warning', 'fields': fields})
+
+def print_error(message, **fields):
+    logger.error(message, extra={'kind': 'error', 'fields': fields})
+
+# Indented continuation lines of a status block
+def print_detail(message):
+    logger.info(message, extra={'kind': 'detail'})
 
 def print_header(message):
-    print(f"\n{PURPLE_BLUE}{Style.BRIGHT}{message}")
-    print(f"{PURPLE_BLUE}{'-' * len(message)}{Style.RESET_ALL}")
+    logger.info(message, extra={'kind': 'header'})
 
 def print_subheader(message):
-    print(f"\n{LIGHT_PURPLE}{Style.BRIGHT}{message}")
-    print(f"{LIGHT_PURPLE}{'-' * len(message)}{Style.RESET_ALL}")
+    logger.info(message, extra={'kind': 'subheader'})
 
 def banner():
     print(f"""
@@ -83,133 +196,1231 @@ def banner():
 {Style.RESET_ALL}
 """)
 
-# Ensure NLTK data is downloaded
+# Ensure NLTK data is downloaded. Only VADER's lexicon is used, and only when the merged
+# lexicon cache has to be rebuilt.
 def ensure_nltk_data():
+    import nltk
     try:
-        nltk.data.find('tokenizers/punkt')
         nltk.data.find('sentiment/vader_lexicon.zip')
     except LookupError:
         print_info("Downloading NLTK data...")
-        nltk.download('punkt', quiet=True)
         nltk.download('vader_lexicon', quiet=True)
 
-# Extract Telegram channel links from messages
-def extract_channel_links(text):
+# t.me / telegram.me links (public usernames, joinchat and + invites) and @mentions, in one compiled pattern.
+# It starts on the literal '.' or '@' so the regex engine can skip ahead cheaply, the host in front
+# of the '.' and the character in front of the '@' are checked in canonical_link.
+LINK_PATTERN = re.compile(r"""
+    \.(?:me|dog)/
+    (?:
+        (?:joinchat/|\+)(?P<invite>[\w-]{10,})
+      | (?:s/)?(?P<username>[A-Za-z]\w{3,31})(?![\w-])
+    )
+  | @(?P<mention>[A-Za-z]\w{3,31})(?!\w)
+""", re.VERBOSE | re.IGNORECASE | re.ASCII)
+
+TELEGRAM_HOST_PATTERN = re.compile(r'(?<![\w-])t(?:elegram)?\Z', re.IGNORECASE | re.ASCII)
+
+BARE_USERNAME_PATTERN = re.compile(r'[A-Za-z]\w{3,31}', re.ASCII)
+
+# t.me paths that look like usernames but aren't channels
+RESERVED_PATHS = frozenset({
+    'joinchat', 'addstickers', 'addemoji', 'addtheme', 'addlist', 'setlanguage', 'share',
+    'proxy', 'socks', 'login', 'invoice', 'boost', 'contact', 'confirmphone', 'iv',
+})
+
+# Canonical key for a LINK_PATTERN match: lowercased username, or a joinchat URL for invites
+def canonical_link(match):
+    text, start = match.string, match.start()
+    mention = match.group('mention')
+    if mention:
+        # Skip e-mail addresses and the like
+        if start and (text[start - 1].isalnum() or text[start - 1] in '_.'):
+            return None
+        username = mention.lower()
+        # Bot usernames always end in 'bot', a mention of one is never a channel
+        if username.endswith('bot'):
+            return None
+    else:
+        if not TELEGRAM_HOST_PATTERN.search(text, max(0, start - 9), start):
+            return None
+        invite = match.group('invite')
+        if invite:
+            # t.me/+<digits> is a phone number, not an invite
+            return None if invite.isdigit() else f'https://t.me/joinchat/{invite}'
+        username = match.group('username').lower()
+    return None if username in RESERVED_PATHS else username
+
+# Extract Telegram channel links from messages, already normalized to canonical keys. Links only seen
+# as @mentions, which are as often users as channels, are also added to mentions when it is given.
+def extract_channel_links(text, mentions=None):
     if not text or not isinstance(text, str):
         return []
-    pattern = r't\.me/(?:joinchat/)?[a-zA-Z0-9_-]+'
-    return re.findall(pattern, text)
+    # Most messages carry no link at all, plain substring checks rule those out faster than the regex scan
+    if '@' not in text:
+        lowered = text.lower()
+        if '.me/' not in lowered and '.dog/' not in lowered:
+            return []
+    links = []
+    linked = set()
+    for match in LINK_PATTERN.finditer(text):
+        link = canonical_link(match)
+        if not link:
+            continue
+        if link not in links:
+            links.append(link)
+        if not match.group('mention'):
+            linked.add(link)
+    if mentions is not None:
+        mentions.update(link for link in links if link not in linked)
+    return links
+
+# URLs a Telethon message hides outside its text: text-url entities and url buttons
+def message_urls(message):
+    urls = [entity.url for entity in getattr(message, 'entities', None) or () if isinstance(entity, types.MessageEntityTextUrl)]
+    reply_markup = getattr(message, 'reply_markup', None)
+    for row in getattr(reply_markup, 'rows', None) or ():
+        urls.extend(button.url for button in row.buttons if getattr(button, 'url', None))
+    return urls
+
+def add_url_links(links, urls):
+    for url in urls:
+        link = clean_link(url)
+        if link and link not in links:
+            links.append(link)
+    return links
+
+# Links in a Telethon message: its text plus hidden text-url entities and url buttons
+def extract_message_links(message, mentions=None):
+    return extract_page_links([message], mentions)
+
+# Links in a page of history, with one scan over all of its text. Newlines keep a link from
+# running across two messages.
+def extract_page_links(messages, mentions=None):
+    links = extract_channel_links('\n'.join(getattr(message, 'raw_text', None) or message.text for message in messages), mentions)
+    urls = [url for message in messages for url in message_urls(message)]
+    if mentions and urls:
+        mentions.difference_update(clean_link(url) for url in urls)
+    return add_url_links(links, urls)
 
 # Clean and format channel links
 def clean_link(link):
     if not link or not isinstance(link, str):
         return None
-    
+    return normalize_link(link)
+
+# The same few links get cleaned over and over (add_channel, mark_as_*, get_affiliation), so memoize
+@functools.lru_cache(maxsize=65536)
+def normalize_link(link):
     link = link.split(')')[0].strip()
     
-    if re.match(r'^[a-zA-Z0-9_]{5,}$', link):
-        return link
+    if BARE_USERNAME_PATTERN.fullmatch(link):
+        return None if link.lower() in RESERVED_PATHS else link.lower()
     
-    match = re.search(r't\.me/(?:joinchat/)?([a-zA-Z0-9_-]+)', link)
+    match = LINK_PATTERN.search(link)
     if match:
-        username_or_hash = match.group(1)
-        
-        if 'joinchat' in link:
-            return f'https://t.me/joinchat/{username_or_hash}'
-        
-        return username_or_hash
+        return canonical_link(match)
     
     return None
 
+# Indicators of compromise are often defanged so they can't be clicked: hxxp://, evil[.]com, user[at]evil[.]com
+REFANG_PATTERN = re.compile(r'hxxps?(?=\[?:)|\[(?:\.|dot|:|://|@|at)\]|\((?:\.|dot|@|at)\)|\{\.\}', re.IGNORECASE)
+
+REFANGS = {'[.]': '.', '[dot]': '.', '(.)': '.', '(dot)': '.', '{.}': '.', '[:]': ':', '[://]': '://', '[@]': '@', '[at]': '@', '(@)': '@', '(at)': '@'}
+
+def refang_match(match):
+    token = match.group().lower()
+    return REFANGS.get(token) or token.replace('xx', 'tt')
+
+def refang(text):
+    return REFANG_PATTERN.sub(refang_match, text)
+
+# Indicators are looked for in two passes. The candidate scan is cheap and only stops at whole tokens that have a
+# '.', ':' or '@' in them, are long enough for a hash or wallet address, or start a CVE id, which rules out the
+# plain words making up most messages. Only those tokens go through the typed pattern. Brackets end a token,
+# except around the IPv6 host of a URL (https://[2001:db8::1]/).
+IOC_CANDIDATE_PATTERN = re.compile(r"""(?<![\w.:@+-])(?:[\w+-]*[.:@](?://(?:[^\s<>"'`,;()\[\]{}|\x00/@]*@)?\[[0-9A-Fa-f:.]+\])?[^\s<>"'`,;()\[\]{}|\x00]*|\w{26,}|[Cc][Vv][Ee]-\d{4}-\d+)""", re.ASCII)
+
+IOC_PATTERN = re.compile(r"""(?<![\w.-])(?:
+    (?P<url>(?:https?|ftp)://(?:(?:[^\s<>"'`,;()\[\]{}|\x00/@]*@)?\[[0-9a-f:.]+\][^\s<>"'`,;()\[\]{}|\x00]*|[^\s<>"'`,;()\[\]{}|\x00]+))
+  | (?P<email>[\w.+-]+@(?:[a-z0-9-]+\.)+[a-z]{2,24})(?![\w-])
+  | (?P<cve>CVE-\d{4}-\d{4,7})(?!\d)
+  | (?P<hash>[0-9a-f]{64}|[0-9a-f]{40}|[0-9a-f]{32})(?!\w)
+  | (?P<eth>0x[0-9a-f]{40})(?!\w)
+  | (?P<ipv4>(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d))(?!\w|\.\d)
+  | (?P<ipv6>(?:[0-9a-f]{0,4}:){2,7}[0-9a-f]{0,4})(?![\w:])
+  | (?P<xmr>(?-i:4[0-9AB][1-9A-HJ-NP-Za-km-z]{93}))(?!\w)
+  | (?P<btc>(?-i:[13][1-9A-HJ-NP-Za-km-z]{25,34}|bc1[02-9ac-hj-np-z]{39,59}))(?!\w)
+  | (?P<domain>(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,24})(?![\w-])
+)""", re.VERBOSE | re.IGNORECASE | re.ASCII)
+
+HASH_TYPES = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+
+NUL_PATTERN = re.compile('\x00')
+
+# A bare name.tld only counts as a domain for a country code or one of the common generic top-level domains,
+# chat text is full of Mr.Smith and backup.old. Hosts of URLs are taken as they are.
+GENERIC_TLDS = frozenset({
+    'com', 'net', 'org', 'info', 'biz', 'name', 'pro', 'mobi', 'asia', 'gov', 'edu', 'mil', 'int', 'onion', 'xyz',
+    'top', 'online', 'site', 'website', 'club', 'shop', 'store', 'app', 'dev', 'cloud', 'live', 'link', 'click', 'icu',
+    'vip', 'tech', 'space', 'fun', 'host', 'buzz', 'work', 'life', 'world', 'today', 'news', 'email', 'support',
+    'services', 'digital', 'network', 'group', 'center', 'ltd', 'company', 'monster', 'cyou', 'rest', 'bond', 'sbs',
+    'cfd', 'quest', 'lol', 'best', 'win', 'bid', 'loan', 'download', 'stream', 'review', 'trade', 'party', 'cam',
+    'guru', 'wiki', 'page', 'blog', 'one', 'finance', 'money', 'cash', 'global', 'agency', 'solutions', 'systems',
+})
+
+# Country codes that are mostly file extensions in chat text (main.py, setup.sh, README.md)
+FILE_EXTENSIONS = frozenset({'py', 'sh', 'js', 'md', 'gz', 'db', 'so', 'rs', 'pl', 'ps', 'ai', 'cc'})
+
+# Channel links are the crawler's business, not indicators
+TELEGRAM_HOSTS = frozenset({'t.me', 'telegram.me', 'telegram.dog', 'telegram.org'})
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+# Legacy Bitcoin addresses carry a checksum, which weeds out the random tokens that happen to look like one
+def is_base58check(address):
+    number = 0
+    for char in address:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    raw = b'\0' * (len(address) - len(address.lstrip('1'))) + number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return len(raw) == 25 and hashlib.sha256(hashlib.sha256(raw[:-4]).digest()).digest()[:4] == raw[-4:]
+
+URL_NETLOC_PATTERN = re.compile(r'[^/?#]*')
+
+# Host of a normalized URL, without credentials or port
+def url_host(url):
+    host = URL_NETLOC_PATTERN.match(url.partition('://')[2]).group().rpartition('@')[2]
+    return host.partition(']')[0] + ']' if host.startswith('[') else host.partition(':')[0]
+
+def is_domain(domain):
+    tld = domain.rpartition('.')[2]
+    if tld in GENERIC_TLDS or (len(tld) == 2 and tld not in FILE_EXTENSIONS):
+        return domain not in TELEGRAM_HOSTS
+    return False
+
+# Typed, normalized indicator for an IOC_PATTERN match: (type, value), or None when it doesn't hold up
+def classify_ioc(match):
+    kind = match.lastgroup
+    value = match.group(kind)
+    if kind == 'url':
+        scheme, _, rest = value.rstrip('.,:;!?').partition('://')
+        netloc = URL_NETLOC_PATTERN.match(rest).group()
+        value = f"{scheme.lower()}://{netloc.lower()}{rest[len(netloc):]}"
+        return None if url_host(value) in TELEGRAM_HOSTS else ('url', value)
+    if kind == 'domain':
+        value = value.lower()
+        return ('domain', value) if is_domain(value) else None
+    if kind == 'email':
+        value = value.lower()
+        return ('email', value) if is_domain(value.rpartition('@')[2]) else None
+    if kind == 'hash':
+        return (HASH_TYPES[len(value)], value.lower()) if not value.isdigit() else None
+    if kind == 'ipv6':
+        try:
+            address = ipaddress.IPv6Address(value)
+        except ValueError:
+            return None
+        return None if address.is_unspecified else ('ipv6', address.compressed)
+    if kind == 'btc':
+        return ('btc', value) if value.startswith('bc1') or is_base58check(value) else None
+    if kind == 'cve':
+        return 'cve', value.upper()
+    if kind == 'eth':
+        return 'eth', value.lower()
+    return kind, value
+
+# (index, type, value) for every distinct indicator in each of texts, after refanging. The texts are joined by
+# NULs and scanned in one go, a page of history is refanged and scanned with one regex call each.
+def extract_iocs(texts):
+    joined = refang('\x00'.join(texts))
+    boundaries = [separator.start() for separator in NUL_PATTERN.finditer(joined)]
+    found = {}
+    for candidate in IOC_CANDIDATE_PATTERN.finditer(joined):
+        index = bisect.bisect(boundaries, candidate.start())
+        for match in IOC_PATTERN.finditer(candidate.group()):
+            indicator = classify_ioc(match)
+            if not indicator:
+                continue
+            found[(index,) + indicator] = None
+            # A URL's host is an indicator in its own right, an IPv6 one comes in brackets
+            if indicator[0] == 'url':
+                host = IOC_PATTERN.fullmatch(url_host(indicator[1]).strip('[]'))
+                if host and host.lastgroup in ('ipv4', 'domain'):
+                    found[(index, host.lastgroup, host.group())] = None
+                elif host and host.lastgroup == 'ipv6' and classify_ioc(host):
+                    found[(index,) + classify_ioc(host)] = None
+    return list(found)
+
+# Case- and compatibility-insensitive form used on both sides of keyword matching
+def normalize_text(text):
+    return unicodedata.normalize('NFKC', text).casefold()
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+# Aho-Corasick automaton over the watchlist, built once so a message is scanned in a single pass
+# however many keywords there are. With word_boundaries a keyword only matches as a whole word.
+class KeywordMatcher:
+    def __init__(self, keywords, word_boundaries=True):
+        self.word_boundaries = word_boundaries
+        self.keywords = []
+        goto = [{}]
+        outputs = [[]]
+        seen = set()
+        for keyword in keywords:
+            pattern = normalize_text(keyword).strip()
+            if not pattern or pattern in seen:
+                continue
+            seen.add(pattern)
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            # A boundary is only required where the keyword itself starts or ends with a word character
+            outputs[state].append((len(self.keywords), len(pattern), is_word_char(pattern[0]), is_word_char(pattern[-1])))
+            self.keywords.append(keyword)
+        
+        # Failure links breadth-first, each state also reporting the keywords that end in its longest proper suffix
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                outputs[next_state] = outputs[next_state] + outputs[fail[next_state]]
+        self.goto = goto
+        self.fail = fail
+        self.outputs = outputs
+        self.alphabet = frozenset(itertools.chain.from_iterable(goto))
+    
+    def __len__(self):
+        return len(self.keywords)
+    
+    # Keywords found in text, in order of first occurrence
+    def match(self, text):
+        if not self.keywords or not text:
+            return []
+        text = normalize_text(text)
+        goto, fail, outputs, alphabet = self.goto, self.fail, self.outputs, self.alphabet
+        found = {}
+        state = 0
+        for end, char in enumerate(text):
+            if char not in alphabet:
+                state = 0
+                continue
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index, length, left, right in outputs[state]:
+                if index in found:
+                    continue
+                if self.word_boundaries:
+                    start = end - length + 1
+                    if left and start > 0 and is_word_char(text[start - 1]):
+                        continue
+                    if right and end + 1 < len(text) and is_word_char(text[end + 1]):
+                        continue
+                found[index] = None
+        return [self.keywords[index] for index in found]
+
+# Frontier scoring: how many channels point at a link, how keyword-heavy those channels are,
+# and how recently (in days of message time) the link was mentioned, mentions older than
+# RECENCY_DAYS adding nothing. Usernames only ever seen as @mentions are often users, not
+# channels, and lose MENTION_PENALTY.
+REFERRER_WEIGHT = 1.0
+KEYWORD_WEIGHT = 2.0
+RECENCY_WEIGHT = 0.1
+RECENCY_DAYS = 30
+MENTION_PENALTY = 1.0
+
+class FrontierEntry:
+    __slots__ = ('key', 'depth', 'referrers', 'last_seen', 'linked', 'version')
+
+    def __init__(self, key, depth):
+        self.key = key
+        self.depth = depth
+        self.referrers = {}  # referring channel -> its keyword hit density
+        self.last_seen = 0.0
+        self.linked = False  # seen as a t.me link, an invite or a config entry rather than only an @mention
+        self.version = 0
+
+    # Age is measured from a fixed reference time (the frontier's creation), so scores don't drift while entries sit in the heap
+    def score(self, now):
+        keyword_density = sum(self.referrers.values()) / len(self.referrers) if self.referrers else 0.0
+        age_days = max(0.0, now - self.last_seen) / 86400
+        return (REFERRER_WEIGHT * math.log1p(len(self.referrers))
+                + KEYWORD_WEIGHT * keyword_density
+                + RECENCY_WEIGHT * max(0.0, RECENCY_DAYS - age_days)
+                - (0.0 if self.linked else MENTION_PENALTY))
+
+# Pending links bucketed by hop distance, each level a max-heap on score. Updating an entry
+# pushes a fresh heap item and bumps its version, stale items are skipped when popped.
+class CrawlFrontier:
+    def __init__(self):
+        self.entries = {}
+        self.levels = {}
+        self.counts = {}  # depth -> pending entries at that depth
+        self.counter = itertools.count()
+        self.now = time.time()
+
+    def add(self, key, depth, referrer=None, keyword_density=0.0, seen_at=None, mention=False):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = FrontierEntry(key, depth)
+            self.counts[depth] = self.counts.get(depth, 0) + 1
+        elif depth < entry.depth:
+            self.counts[entry.depth] -= 1
+            self.counts[depth] = self.counts.get(depth, 0) + 1
+            entry.depth = depth
+        if referrer:
+            entry.referrers[referrer] = max(keyword_density, entry.referrers.get(referrer, 0.0))
+        if seen_at:
+            entry.last_seen = max(entry.last_seen, seen_at)
+        if not mention:
+            entry.linked = True
+        entry.version += 1
+        heapq.heappush(self.levels.setdefault(entry.depth, []), (-entry.score(self.now), next(self.counter), key, entry.version))
+
+    def pop(self, depth=None):
+        if depth is None:
+            depth = self.min_depth()
+        heap = self.levels.get(depth)
+        while heap:
+            _, _, key, version = heapq.heappop(heap)
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == version and entry.depth == depth:
+                del self.entries[key]
+                self.counts[depth] -= 1
+                return key
+        return None
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.counts[entry.depth] -= 1
+
+    def pending(self, depth):
+        return self.counts.get(depth, 0)
+
+    def has_pending(self, depth=None):
+        if depth is None:
+            return bool(self.entries)
+        return self.counts.get(depth, 0) > 0
+
+    def min_depth(self):
+        return min((depth for depth, count in self.counts.items() if count), default=0)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
 # Manage discovered channels
 class ChannelManager:
-    def __init__(self):
-        self.discovered_channels = set()
+    def __init__(self, store=None):
+        self.discovered_channels = CrawlFrontier()
         self.joined_channels = set()
         self.processed_channels = set()
+        self.in_progress_channels = set()
         self.channel_affiliations = {}
+        self.channel_depths = {}
         self.initial_channels = set()
+        self.store = store
 
-    def add_channel(self, link, source_channel=None):
+    def add_channel(self, link, source_channel=None, depth=0, keyword_density=0.0, seen_at=None, mention=False):
         cleaned_link = clean_link(link)
-        if cleaned_link and cleaned_link not in self.joined_channels and cleaned_link not in self.processed_channels:
-            self.discovered_channels.add(cleaned_link)
+        if cleaned_link and cleaned_link not in self.joined_channels and cleaned_link not in self.processed_channels and cleaned_link not in self.in_progress_channels:
+            self.discovered_channels.add(cleaned_link, depth, source_channel, keyword_density, seen_at, mention)
+            self.channel_depths[cleaned_link] = min(depth, self.channel_depths.get(cleaned_link, depth))
             if source_channel:
                 self.channel_affiliations[cleaned_link] = source_channel
             else:
                 self.initial_channels.add(cleaned_link)  # Mark as initial channel if no source
+            if self.store:
+                self.store.record_discovered(cleaned_link, depth, source_channel, keyword_density, seen_at)
 
     def mark_as_joined(self, link):
         cleaned_link = clean_link(link)
         if cleaned_link:
             self.joined_channels.add(cleaned_link)
             self.discovered_channels.discard(cleaned_link)
+            if self.store:
+                self.store.set_state(cleaned_link, 'joined')
 
     def mark_as_processed(self, link):
         cleaned_link = clean_link(link)
         if cleaned_link:
             self.processed_channels.add(cleaned_link)
             self.discovered_channels.discard(cleaned_link)
+            self.in_progress_channels.discard(cleaned_link)
 
-    def has_unprocessed_channels(self):
-        return len(self.discovered_channels) > 0
-
-    def get_next_channel(self):
-        if self.discovered_channels:
-            return self.discovered_channels.pop()
-        return None
+    # On disk a channel only counts as processed once its messages are saved (see process_channel),
+    # a crash before that and it gets scraped again on resume
+    def save_processed(self, link):
+        cleaned_link = clean_link(link)
+        if cleaned_link and self.store:
+            self.store.set_state(cleaned_link, 'processed')
+
+    # Reload the frontier and visited sets of an interrupted crawl
+    def resume(self):
+        referrers = self.store.load_referrers()
+        for key, state, depth, affiliation, last_seen in self.store.load():
+            self.channel_depths[key] = depth
+            if affiliation:
+                self.channel_affiliations[key] = affiliation
+            else:
+                self.initial_channels.add(key)
+            if state == 'processed':
+                self.processed_channels.add(key)
+                continue
+            # Joined but never marked processed means it was mid-scrape when we stopped
+            self.discovered_channels.add(key, depth, seen_at=last_seen)
+            for referrer, keyword_density in referrers.get(key, ()):
+                self.discovered_channels.add(key, depth, referrer, keyword_density)
+
+    # Pending work, optionally only at one hop distance (BFS level)
+    def has_unprocessed_channels(self, depth=None):
+        return self.discovered_channels.has_pending(depth)
+
+    # Best-scoring pending link, optionally restricted to one hop distance
+    def get_next_channel(self, depth=None):
+        link = self.discovered_channels.pop(depth)
+        if link is not None:
+            self.in_progress_channels.add(link)
+        return link
 
     def get_affiliation(self, link):
         cleaned_link = clean_link(link)
         return self.channel_affiliations.get(cleaned_link, None)
 
+    def get_depth(self, link):
+        cleaned_link = clean_link(link)
+        return self.channel_depths.get(cleaned_link, 0)
+
+    def min_pending_depth(self):
+        return self.discovered_channels.min_depth()
+
     def display_status(self):
         print_subheader("Channel Status")
-        print(f"  Channels waiting to be processed: {len(self.discovered_channels)}")
-        print(f"  Channels joined: {len(self.joined_channels)}")
-        print(f"  Channels processed: {len(self.processed_channels)}")
+        print_detail(f"  Channels waiting to be processed: {len(self.discovered_channels)}")
+        print_detail(f"  Channels joined: {len(self.joined_channels)}")
+        print_detail(f"  Channels processed: {len(self.processed_channels)}")
+
+# Latency histogram buckets in seconds, from cached lookups up to long FloodWait sleeps
+METRIC_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+# In-process counters, latency histograms and gauges. Updates are a dict lookup and an add, so they
+# stay on in production; gauges are callables read only when the metrics are exported.
+class Metrics:
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    # Times the block into a histogram, works around awaits too
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, read, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = read
+
+    def read_gauges(self):
+        values = {}
+        for key, read in self.gauges.items():
+            try:
+                values[key] = float(read())
+            except Exception:
+                continue
+        return values
+
+    def snapshot(self):
+        def series(key, **fields):
+            return {'name': key[0], 'labels': dict(key[1]), **fields}
+        return {
+            'timestamp': time.time(),
+            'counters': [series(key, value=value) for key, value in self.counters.items()],
+            'gauges': [series(key, value=value) for key, value in self.read_gauges().items()],
+            'histograms': [
+                series(key, buckets=dict(zip(map(str, self.buckets + ('+Inf',)), itertools.accumulate(counts))), sum=total, count=count)
+                for key, (counts, total, count) in self.histograms.items()
+            ],
+        }
+
+    # Prometheus text exposition format
+    def render(self):
+        def labels_text(labels, **extra):
+            pairs = list(labels) + list(extra.items())
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+        lines = []
+        typed = set()
+        def series(kind, key, suffix, value, **extra):
+            if key[0] not in typed:
+                typed.add(key[0])
+                lines.append(f"# TYPE {key[0]} {kind}")
+            lines.append(f"{key[0]}{suffix}{labels_text(key[1], **extra)} {value}")
+        for key, value in sorted(self.counters.items()):
+            series('counter', key, '', value)
+        for key, value in sorted(self.read_gauges().items()):
+            series('gauge', key, '', value)
+        for key, (counts, total, count) in sorted(self.histograms.items()):
+            for bound, cumulative in zip(self.buckets + ('+Inf',), itertools.accumulate(counts)):
+                series('histogram', key, '_bucket', cumulative, le=bound)
+            series('histogram', key, '_sum', total)
+            series('histogram', key, '_count', count)
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# Label values are quoted in the exposition format, channel names and error messages can hold anything
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Serve the metrics as plain HTTP on GET /metrics for a Prometheus scraper
+async def start_metrics_server(port, host='127.0.0.1'):
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # headers
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', metrics.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    server = await asyncio.start_server(handle, host, port)
+    print_info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+# Write a JSON snapshot of the metrics every interval seconds, replacing the file atomically
+async def dump_metrics(path, interval=15):
+    while True:
+        await asyncio.sleep(interval)
+        write_metrics_file(path)
+
+# Times every call of a coroutine function into a histogram
+def timed_metric(name, **labels):
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with metrics.timer(name, **labels):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def write_metrics_file(path):
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(metrics.snapshot(), f)
+    os.replace(temporary, path)
+
+# Share of the --requests-per-second budget (and burst size) given to each request class
+REQUEST_CLASSES = {
+    'resolve': (0.5, 3),   # ResolveUsername
+    'join': (0.2, 2),      # JoinChannel
+    'history': (1.0, 5),   # GetHistory
+    'takeout': (4.0, 10),  # GetHistory inside a takeout session, which Telegram limits far less
+}
+
+# Token bucket for one request class. A FloodWait pauses it for exactly as long as
+# Telegram asked and halves its rate, which then creeps back to the base rate.
+class TokenBucket:
+    def __init__(self, rate, burst, min_rate=0.01, recovery_period=600, name=None):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.recovery_period = recovery_period
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.flood_waits = 0
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if now < self.paused_until:
+            return
+        self.rate = min(self.base_rate, self.rate + elapsed * self.base_rate / self.recovery_period)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self.refill()
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    metrics.inc('telehunting_rate_limit_sleep_seconds_total', pause, request=self.name, reason='flood_wait')
+                    await asyncio.sleep(pause)
+                    continue
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                metrics.inc('telehunting_rate_limit_sleep_seconds_total', wait, request=self.name, reason='throttle')
+                await asyncio.sleep(wait)
+
+    def penalize(self, seconds):
+        self.refill()
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.flood_waits += 1
+        metrics.inc('telehunting_flood_waits_total', request=self.name)
+        metrics.inc('telehunting_flood_wait_seconds_total', seconds, request=self.name)
+
+# One limiter shared by every crawl worker, with a bucket per request class
+class RateLimiter:
+    def __init__(self, requests_per_second=1.0):
+        self.buckets = {
+            request_class: TokenBucket(share * requests_per_second, burst, name=request_class)
+            for request_class, (share, burst) in REQUEST_CLASSES.items()
+        }
+
+    async def acquire(self, request_class):
+        metrics.inc('telehunting_requests_total', request=request_class)
+        await self.buckets[request_class].acquire()
 
-# Join channel by url
-async def join_channel(client, channel_manager, link, max_retries=3):
+    def report_flood_wait(self, request_class, seconds):
+        self.buckets[request_class].penalize(seconds)
+
+    # Take a token, and feed any FloodWait raised inside the block back into the bucket
+    @asynccontextmanager
+    async def limit(self, request_class):
+        await self.acquire(request_class)
+        try:
+            yield
+        except errors.FloodWaitError as e:
+            self.report_flood_wait(request_class, e.seconds)
+            raise
+
+    # How long until the given request classes (all of them by default) are usable again, 0 when none is flood-waited
+    def paused_for(self, *request_classes):
+        buckets = [self.buckets[request_class] for request_class in request_classes] if request_classes else self.buckets.values()
+        return max(0, max(bucket.paused_until for bucket in buckets) - time.monotonic())
+
+    def budget(self):
+        now = time.monotonic()
+        report = {}
+        for request_class, bucket in self.buckets.items():
+            bucket.refill()
+            report[request_class] = {
+                'rate': bucket.rate,
+                'base_rate': bucket.base_rate,
+                'tokens': bucket.tokens,
+                'paused_for': max(0, bucket.paused_until - now),
+                'flood_waits': bucket.flood_waits,
+            }
+        return report
+
+    def display_budget(self, account=None):
+        print_subheader(f"Rate Limit Budget ({account})" if account else "Rate Limit Budget")
+        for request_class, budget in self.budget().items():
+            status = f"paused for {budget['paused_for']:.0f}s" if budget['paused_for'] else f"{budget['tokens']:.1f} tokens"
+            print_detail(f"  {request_class}: {budget['rate']:.2f}/{budget['base_rate']:.2f} req/s, {status}, {budget['flood_waits']} flood waits")
+
+# One Telegram session in the client pool, with its own rate limits and its own entity access hashes
+class Account:
+    def __init__(self, name, client, phone_number=None):
+        self.name = name
+        self.client = client
+        self.phone_number = phone_number
+        self.rate_limiter = None
+        self.entity_cache = None
+        self.memberships = None
+        self.history_client = None  # a takeout session for bulk history, when one is open
+
+# Clients for every session in config['accounts'], or the single session given on the command line
+def create_accounts(config, api_id=None, api_hash=None, phone_number=None):
+    from telethon.sync import TelegramClient
+    entries = config.get('accounts') or [{'session': 'session_name'}]
+    accounts = []
+    for entry in entries:
+        entry_api_id = entry.get('api_id') or api_id
+        entry_api_hash = entry.get('api_hash') or api_hash
+        if not entry_api_id or not entry_api_hash:
+            raise ValueError(f"Account {entry['session']} has no API credentials")
+        client = TelegramClient(entry['session'], entry_api_id, entry_api_hash)
+        accounts.append(Account(entry['session'], client, entry.get('phone_number') or (None if config.get('accounts') else phone_number)))
+    return accounts
+
+# On-disk state (entity cache and friends) lives in one SQLite file
+def open_state_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+# Just enough of a resolved peer to join, scrape and name it without asking Telegram again
+class CachedEntity:
+    __slots__ = ('peer_id', 'access_hash', 'type', 'title', 'username')
+
+    def __init__(self, peer_id, access_hash, type, title, username):
+        self.peer_id = peer_id
+        self.access_hash = access_hash
+        self.type = type
+        self.title = title
+        self.username = username
+
+    @classmethod
+    def from_entity(cls, entity):
+        if isinstance(entity, types.User):
+            return cls(entity.id, entity.access_hash, 'user', None, entity.username)
+        if isinstance(entity, types.Channel):
+            return cls(entity.id, entity.access_hash, 'channel', entity.title, entity.username)
+        if isinstance(entity, types.Chat):
+            return cls(entity.id, None, 'chat', entity.title, None)
+        raise ValueError(f"Unknown entity type {type(entity).__name__}")
+
+    @property
+    def input_peer(self):
+        if self.type == 'channel':
+            return types.InputPeerChannel(self.peer_id, self.access_hash)
+        if self.type == 'chat':
+            return types.InputPeerChat(self.peer_id)
+        return types.InputPeerUser(self.peer_id, self.access_hash)
+
+    @property
+    def name(self):
+        if self.type == 'user':
+            return f"@{self.username}" if self.username else f"User({self.peer_id})"
+        return self.title or f"Channel({self.peer_id})"
+
+class UnresolvableLinkError(ValueError):
+    pass
+
+# Errors that mean a link will not resolve no matter how often we ask
+def permanent_resolve_errors():
+    return (ValueError, errors.UsernameInvalidError, errors.UsernameNotOccupiedError, errors.ChannelPrivateError,
+            errors.ChannelInvalidError, errors.InviteHashExpiredError, errors.InviteHashInvalidError)
+
+# Disk-backed map from clean_link keys to resolved peers, with negative entries for dead links. All accounts
+# use the same tables, but channel and user access hashes are only valid for the account that resolved them:
+# the primary account keeps its hash in entity_cache, every other account its own in entity_access. So only
+# negative entries and metadata are shared, an entity another account resolved is still a miss (and a
+# ResolveUsername call) for this one.
+class EntityCache:
+    def __init__(self, conn, ttl=7 * 24 * 3600, negative_ttl=24 * 3600, account=None):
+        self.conn = conn
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.account = account
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        self.foreign_misses = 0  # misses on entities another account has resolved
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entity_cache (
+                key TEXT PRIMARY KEY,
+                peer_id INTEGER,
+                access_hash INTEGER,
+                type TEXT,
+                title TEXT,
+                username TEXT,
+                error TEXT,
+                resolved_at REAL NOT NULL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entity_access (
+                account TEXT NOT NULL,
+                peer_id INTEGER NOT NULL,
+                access_hash INTEGER NOT NULL,
+                PRIMARY KEY (account, peer_id)
+            )""")
+        self.conn.commit()
+
+    # Returns a CachedEntity, an error string for a cached failure, or None on a miss
+    def get(self, key):
+        row = self.memory.get(key)
+        if row is None:
+            row = self.conn.execute(
+                "SELECT peer_id, access_hash, type, title, username, error, resolved_at FROM entity_cache WHERE key = ?",
+                (key,)).fetchone()
+            if row is not None and self.account and not row[5]:
+                access = self.conn.execute("SELECT access_hash FROM entity_access WHERE account = ? AND peer_id = ?",
+                                           (self.account, row[0])).fetchone()
+                row = (row[0], access[0] if access else None, *row[2:])
+        if row is not None:
+            peer_id, access_hash, type, title, username, error, resolved_at = row
+            # Another account resolved it, this one still needs its own access hash
+            usable = error or access_hash is not None or type == 'chat'
+            fresh = time.time() - resolved_at < (self.negative_ttl if error else self.ttl)
+            if usable and fresh:
+                self.memory[key] = row
+                self.hits += 1
+                return error or CachedEntity(peer_id, access_hash, type, title, username)
+            if fresh:
+                self.foreign_misses += 1
+            self.memory.pop(key, None)
+        self.misses += 1
+        return None
+
+    def put(self, key, entity):
+        row = (entity.peer_id, entity.access_hash, entity.type, entity.title, entity.username, None, time.time())
+        self.memory[key] = row
+        if not self.account:
+            self.conn.execute("INSERT OR REPLACE INTO entity_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (key, *row))
+        else:
+            # Leave the primary account's access hash alone
+            self.conn.execute("""
+                INSERT INTO entity_cache VALUES (?, ?, NULL, ?, ?, ?, NULL, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    access_hash = CASE WHEN entity_cache.peer_id = excluded.peer_id THEN entity_cache.access_hash END,
+                    peer_id = excluded.peer_id, type = excluded.type, title = excluded.title,
+                    username = excluded.username, error = NULL, resolved_at = excluded.resolved_at""",
+                (key, entity.peer_id, entity.type, entity.title, entity.username, row[6]))
+            if entity.access_hash is not None:
+                self.conn.execute("INSERT OR REPLACE INTO entity_access VALUES (?, ?, ?)", (self.account, entity.peer_id, entity.access_hash))
+
+    # A failure only replaces another failure or a stale entity. One account failing to resolve a link
+    # (banned from it, restricted in its region) mustn't wipe the entity another account resolved.
+    def put_negative(self, key, error):
+        row = (None, None, None, None, None, error or 'unresolvable', time.time())
+        self.memory[key] = row
+        self.conn.execute("""
+            INSERT INTO entity_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                peer_id = NULL, access_hash = NULL, type = NULL, title = NULL, username = NULL,
+                error = excluded.error, resolved_at = excluded.resolved_at
+            WHERE entity_cache.error IS NOT NULL OR entity_cache.resolved_at < ?""",
+            (key, *row, row[6] - self.ttl))
+
+    def display_stats(self):
+        account = f" ({self.account})" if self.account else ""
+        foreign = f" ({self.foreign_misses} already resolved by another account, access hashes are per account)" if self.foreign_misses else ""
+        print_info(f"Entity cache{account}: {self.hits} hits, {self.misses} resolves{foreign}")
+
+# Resolve a cleaned link once, going to Telegram only when the cache has nothing fresh
+async def resolve_entity(client, cleaned_link, rate_limiter, entity_cache=None):
+    cached = entity_cache.get(cleaned_link) if entity_cache else None
+    if isinstance(cached, CachedEntity):
+        metrics.inc('telehunting_entity_cache_total', result='hit')
+        return cached
+    if cached is not None:
+        metrics.inc('telehunting_entity_cache_total', result='negative_hit')
+        raise UnresolvableLinkError(f"{cleaned_link} previously failed to resolve: {cached}")
+    metrics.inc('telehunting_entity_cache_total', result='miss')
+
+    try:
+        async with rate_limiter.limit('resolve'):
+            with metrics.timer('telehunting_request_seconds', request='get_entity'):
+                entity = await client.get_entity(cleaned_link)
+    except permanent_resolve_errors() as e:
+        if entity_cache:
+            entity_cache.put_negative(cleaned_link, str(e))
+        raise UnresolvableLinkError(str(e)) from e
+
+    entity = CachedEntity.from_entity(entity)
+    if entity_cache:
+        entity_cache.put(cleaned_link, entity)
+    return entity
+
+# Channels an account is a member of, persisted per account. Public channel history can be read
+# without joining, so 'auto' only joins when monitor mode needs a channel's updates, 'always' joins
+# every public channel as the crawler used to. Joins past the membership limit first leave the least
+# recently scraped channel that isn't being scraped right now, channels kept for --monitor are never left.
+class MembershipManager:
+    def __init__(self, conn, client, rate_limiter, account=None, limit=500, join_mode='auto', keep_joined=False):
+        self.conn = conn
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.account = account
+        self.limit = limit
+        self.join_mode = join_mode
+        self.keep_joined = keep_joined
+        self.in_use = {}  # peer_id -> workers currently scraping it
+        self.lock = asyncio.Lock()
+        self.joins = 0
+        self.leaves = 0
+        self.skipped = 0
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS memberships (
+                account TEXT NOT NULL,
+                peer_id INTEGER NOT NULL,
+                access_hash INTEGER,
+                name TEXT,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (account, peer_id)
+            )""")
+        self.conn.commit()
+        # peer_id -> (access_hash, name), least recently used first
+        self.members = OrderedDict(
+            (peer_id, (access_hash, name)) for peer_id, access_hash, name in self.conn.execute(
+                "SELECT peer_id, access_hash, name FROM memberships WHERE account = ? ORDER BY last_used", (account or '',)))
+
+    def __contains__(self, peer_id):
+        return peer_id in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    # A flood-waited join class means reading without joining until the pause is over
+    def should_join(self):
+        if self.rate_limiter.paused_for('join'):
+            return False
+        return self.join_mode == 'always' or (self.join_mode == 'auto' and self.keep_joined)
+
+    # Make a public channel readable for a scrape, joining it only when the join mode asks for it. Returns
+    # whether the account is a member. Every acquire is paired with a release once the scrape is done.
+    async def acquire(self, entity):
+        # One membership change at a time, so concurrent workers can't overshoot the limit together
+        async with self.lock:
+            member = True
+            if entity.peer_id in self.members:
+                self.members.move_to_end(entity.peer_id)
+            elif not self.should_join() or (len(self.members) >= self.limit and not await self.evict()) or not await self.join(entity):
+                member = False
+                self.skipped += 1
+                metrics.inc('telehunting_membership_changes_total', action='read_without_joining')
+            self.in_use[entity.peer_id] = self.in_use.get(entity.peer_id, 0) + 1
+            return member
+
+    async def join(self, entity):
+        try:
+            async with self.rate_limiter.limit('join'):
+                with metrics.timer('telehunting_request_seconds', request='join'):
+                    await self.client(functions.channels.JoinChannelRequest(entity.input_peer))
+        except errors.ChannelsTooMuchError:
+            # The account is at Telegram's limit with channels we don't know about, make room once
+            self.limit = len(self.members)
+            print_warning(f"Channel membership limit reached at {self.limit} channels, leaving old channels to make room")
+            if not await self.evict():
+                return False
+            async with self.rate_limiter.limit('join'):
+                with metrics.timer('telehunting_request_seconds', request='join'):
+                    await self.client(functions.channels.JoinChannelRequest(entity.input_peer))
+        self.joins += 1
+        metrics.inc('telehunting_membership_changes_total', action='join')
+        self.members[entity.peer_id] = (entity.access_hash, entity.name)
+        self.conn.execute("INSERT OR REPLACE INTO memberships VALUES (?, ?, ?, ?, ?)",
+                          (self.account or '', entity.peer_id, entity.access_hash, entity.name, time.time()))
+        return True
+
+    def release(self, entity):
+        remaining = self.in_use.get(entity.peer_id, 1) - 1
+        if remaining:
+            self.in_use[entity.peer_id] = remaining
+        else:
+            self.in_use.pop(entity.peer_id, None)
+        if entity.peer_id in self.members:
+            self.conn.execute("UPDATE memberships SET last_used = ? WHERE account = ? AND peer_id = ?",
+                              (time.time(), self.account or '', entity.peer_id))
+
+    # Leave the least recently used channel nobody is scraping, False when there is none to leave
+    async def evict(self):
+        if self.keep_joined:
+            return False
+        peer_id = next((peer_id for peer_id in self.members if peer_id not in self.in_use), None)
+        if peer_id is None:
+            return False
+        access_hash, name = self.members.pop(peer_id)
+        try:
+            async with self.rate_limiter.limit('join'):
+                with metrics.timer('telehunting_request_seconds', request='leave'):
+                    await self.client(functions.channels.LeaveChannelRequest(types.InputPeerChannel(peer_id, access_hash)))
+        except errors.FloodWaitError:
+            self.members[peer_id] = (access_hash, name)
+            self.members.move_to_end(peer_id, last=False)
+            raise
+        except (errors.ChannelPrivateError, errors.ChannelInvalidError, errors.UserNotParticipantError):
+            pass  # Already gone one way or another
+        self.conn.execute("DELETE FROM memberships WHERE account = ? AND peer_id = ?", (self.account or '', peer_id))
+        self.leaves += 1
+        metrics.inc('telehunting_membership_changes_total', action='leave')
+        print_debug(f"Left {name} to stay under the membership limit")
+        return True
+
+    def display_stats(self):
+        account = f" ({self.account})" if self.account else ""
+        print_info(f"Memberships{account}: {len(self.members)}/{self.limit}, {self.joins} joined, {self.leaves} left, {self.skipped} read without joining")
+
+# Join channel by url, returns the resolved entity so callers don't resolve it again
+@timed_metric('telehunting_join_channel_seconds')
+async def join_channel(client, channel_manager, link, max_retries=3, rate_limiter=None, entity_cache=None, memberships=None):
     cleaned_link = clean_link(link)
     if not cleaned_link:
         print_warning(f"Invalid link format: {link}")
-        return False
+        return None
 
+    rate_limiter = rate_limiter or RateLimiter()
     retries = 0
     while retries < max_retries:
         try:
-            entity = await client.get_entity(cleaned_link)
-            entity_name = await get_entity_name(entity)
+            entity = await resolve_entity(client, cleaned_link, rate_limiter, entity_cache)
+            entity_name = entity.name
             
-            if isinstance(entity, (Channel, Chat)):
-                if entity.username:
-                    await client(JoinChannelRequest(entity))
+            joined = False
+            if entity.type in ('channel', 'chat'):
+                if entity.username and memberships is not None:
+                    joined = await memberships.acquire(entity)
+                elif entity.username and rate_limiter.paused_for('join'):
+                    print_debug(f"Joins are flood-waited, reading {entity_name} without joining")
+                elif entity.username:
+                    async with rate_limiter.limit('join'):
+                        with metrics.timer('telehunting_request_seconds', request='join'):
+                            await client(functions.channels.JoinChannelRequest(entity.input_peer))
+                    joined = True
                 else:
                     print_warning(f"Cannot join private channel {entity_name} without an invite link")
-                    return False
-            elif isinstance(entity, User):
-                print_info(f"Entity {entity_name} is a user, no need to join")
+                    return None
             else:
-                print_warning(f"Unknown entity type for {entity_name}")
-                return False
+                print_info(f"Entity {entity_name} is a user, no need to join")
             
             print_success(f"Successfully processed entity: {entity_name}")
-            channel_manager.mark_as_joined(cleaned_link)
-            return True
-
-        except FloodWaitError as e:
-            wait_time = min(e.seconds, 30)
-            print_warning(f"FloodWaitError encountered. Waiting for {wait_time} seconds. (Attempt {retries + 1}/{max_retries})")
-            await asyncio.sleep(wait_time)
+            # Only channels an account is a member of count as joined, monitor mode watches those
+            if joined:
+                channel_manager.mark_as_joined(cleaned_link)
+            metrics.inc('telehunting_join_channel_total', result='joined' if joined else 'read_without_joining')
+            return entity
+
+        except errors.FloodWaitError as e:
+            # The limiter has paused the request class that hit the wait. A paused join is skipped on the
+            # next attempt, which reads without joining; any other class sleeps it off on the next acquire.
+            print_warning(f"FloodWaitError encountered for {e.seconds} seconds. (Attempt {retries + 1}/{max_retries})")
+        except UnresolvableLinkError as e:
+            print_warning(f"Cannot resolve {cleaned_link}: {e}")
+            metrics.inc('telehunting_join_channel_total', result='unresolvable')
+            return None
         except Exception as e:
             print_error(f"Failed to process entity {cleaned_link}: {e}")
+            await asyncio.sleep(1)
         
         retries += 1
-        await asyncio.sleep(1)
 
     print_warning(f"Max retries exceeded. Failed to process entity: {cleaned_link}")
-    return False
+    metrics.inc('telehunting_join_channel_total', result='failed')
+    return None
+
+# Per-channel high-water marks, so later runs only fetch what they haven't seen
+class CheckpointStore:
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                peer_id INTEGER PRIMARY KEY,
+                newest_id INTEGER NOT NULL,
+                oldest_id INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )""")
+        self.conn.commit()
+
+    # Returns (newest_id, oldest_id) or None for a channel we have never scraped
+    def get(self, peer_id):
+        return self.conn.execute("SELECT newest_id, oldest_id FROM checkpoints WHERE peer_id = ?", (peer_id,)).fetchone()
+
+    def update(self, peer_id, newest_id, oldest_id):
+        self.conn.execute("""
+            INSERT INTO checkpoints VALUES (?, ?, ?, ?)
+            ON CONFLICT(peer_id) DO UPDATE SET
+                newest_id = MAX(newest_id, excluded.newest_id),
+                oldest_id = MIN(oldest_id, excluded.oldest_id),
+                updated_at = excluded.updated_at""", (peer_id, newest_id, oldest_id, time.time()))
+
+# Slices of history still to fetch for a channel, as (reverse, offset_id) passes
+def plan_history(checkpoint, backfill=False):
+    if checkpoint is None:
+        return [(False, 0)]  # never seen, newest first as before
+    newest_id, oldest_id = checkpoint
+    # New messages come oldest first from the high-water mark, so a capped pass never leaves a gap
+    passes = [(True, newest_id)]
+    if backfill and oldest_id > 1:
+        passes.append((False, oldest_id))
+    return passes
+
+# Frontier, visited sets and link depths on disk, so an interrupted crawl can pick up where it stopped
+class CrawlStateStore:
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_channels (
+                key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                affiliation TEXT,
+                last_seen REAL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_referrers (
+                key TEXT NOT NULL,
+                referrer TEXT NOT NULL,
+                keyword_density REAL NOT NULL,
+                PRIMARY KEY (key, referrer)
+            )""")
+        self.conn.commit()
+
+    def reset(self):
+        self.conn.execute("DELETE FROM crawl_channels")
+        self.conn.execute("DELETE FROM crawl_referrers")
+        self.conn.commit()
+
+    def record_discovered(self, key, depth, affiliation, keyword_density=0.0, last_seen=None):
+        self.conn.execute("""
+            INSERT INTO crawl_channels VALUES (?, 'discovered', ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                depth = MIN(depth, excluded.depth),
+                affiliation = COALESCE(excluded.affiliation, affiliation),
+                last_seen = MAX(COALESCE(last_seen, 0), COALESCE(excluded.last_seen, 0))""", (key, depth, affiliation, last_seen))
+        if affiliation:
+            self.conn.execute("""
+                INSERT INTO crawl_referrers VALUES (?, ?, ?)
+                ON CONFLICT(key, referrer) DO UPDATE SET
+                    keyword_density = MAX(keyword_density, excluded.keyword_density)""", (key, affiliation, keyword_density))
+
+    def set_state(self, key, state):
+        self.conn.execute("UPDATE crawl_channels SET state = ? WHERE key = ?", (state, key))
+
+    def commit(self):
+        self.conn.commit()
+
+    def load(self):
+        return self.conn.execute("SELECT key, state, depth, affiliation, last_seen FROM crawl_channels").fetchall()
+
+    def load_referrers(self):
+        referrers = {}
+        for key, referrer, keyword_density in self.conn.execute("SELECT key, referrer, keyword_density FROM crawl_referrers"):
+            referrers.setdefault(key, []).append((referrer, keyword_density))
+        return referrers
 
 # Load configuration
 def load_config(config_path):
@@ -223,6 +1434,7 @@ def create_default_config(config_path):
     default_config = {
         "initial_channel_links": [],
         "message_keywords": [],
+        "keyword_word_boundaries": True,
         "batch_size": 100
     }
     with open(config_path, 'w') as f:
@@ -231,84 +1443,186 @@ def create_default_config(config_path):
     print_info("Please edit this file with your channel links and keywords.")
     return default_config
 
+# Column order of the score arrays returned by CybersecuritySentimentAnalyzer.score_batch
+SENTIMENT_FIELDS = ('neg', 'neu', 'pos', 'compound')
+
 # Home made sentiment lexicon (this is my first time doing this, it may suck)
+CYBERSECURITY_LEXICON = {
+    'vulnerability': 2.0,
+    'exploit': -3.0,
+    'patch': 2.0,
+    'hack': -2.0,
+    'secure': 3.0,
+    'breach': -4.0,
+    'protect': 3.0,
+    'malware': -3.0,
+    'ransomware': -4.0,
+    'encryption': 2.0,
+    'backdoor': -3.0,
+    'firewall': 2.0,
+    'phishing': -3.0,
+    'authentication': 2.0,
+    'threat': -2.0,
+    'zero-day': -4.0,
+    'security': 1.0,
+    'attack': -2.0,
+    'defense': 2.0,
+    'compromise': -3.0
+}
+
+# The merged lexicon is pickled under a name that changes with the NLTK release and our own lexicon
+def lexicon_cache_path():
+    from importlib.metadata import version
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    key = hashlib.blake2b(json.dumps([version('nltk'), CYBERSECURITY_LEXICON], sort_keys=True).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, 'telehunting', f'lexicon-{key}.pickle')
+
+# VADER's lexicon with ours merged in. Parsing VADER's text file and merging happens once per
+# machine, later launches unpickle the result.
+@functools.lru_cache(maxsize=None)
+def load_lexicon():
+    path = lexicon_cache_path()
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    ensure_nltk_data()
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    lexicon = SentimentIntensityAnalyzer().lexicon
+    lexicon.update(CYBERSECURITY_LEXICON)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.{os.getpid()}", 'wb') as f:
+            pickle.dump(lexicon, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.{os.getpid()}", path)
+    except OSError as e:
+        print_debug(f"Could not cache the sentiment lexicon at {path}: {e}")
+    return lexicon
+
 class CybersecuritySentimentAnalyzer:
-    def __init__(self):
-        self.sia = SentimentIntensityAnalyzer()
-        self.cybersecurity_lexicon = {
-            'vulnerability': 2.0,
-            'exploit': -3.0,
-            'patch': 2.0,
-            'hack': -2.0,
-            'secure': 3.0,
-            'breach': -4.0,
-            'protect': 3.0,
-            'malware': -3.0,
-            'ransomware': -4.0,
-            'encryption': 2.0,
-            'backdoor': -3.0,
-            'firewall': 2.0,
-            'phishing': -3.0,
-            'authentication': 2.0,
-            'threat': -2.0,
-            'zero-day': -4.0,
-            'security': 1.0,
-            'attack': -2.0,
-            'defense': 2.0,
-            'compromise': -3.0
-        }
-        self.sia.lexicon.update(self.cybersecurity_lexicon)
+    def __init__(self, cache_size=100000):
+        from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+        # VADER's constructor would read and parse its lexicon file again
+        self.sia = SentimentIntensityAnalyzer.__new__(SentimentIntensityAnalyzer)
+        self.sia.lexicon = load_lexicon()
+        self.sia.constants = VaderConstants()
+        self.cache_size = cache_size
+        self.score_cache = OrderedDict()
+        self.cybersecurity_lexicon = CYBERSECURITY_LEXICON
 
     def polarity_scores(self, text):
         return self.sia.polarity_scores(text)
 
-# Global variables
-current_batch = []
-batch_counter = 1
-
-# keyboard interrupt (Ctrl+C)
-def signal_handler(sig, frame):
-    global current_batch, batch_counter
-    print_warning(f"\nKeyboard interrupt received. Saving current batch and exiting...")
-    save_current_batch(current_batch, batch_counter)
-    exit(0)
-
-# Save current batch to CSV
-def save_current_batch(batch, batch_counter):
-    if batch:
-        df = pd.DataFrame(batch, columns=['Sender ID', 'Date', 'Message', 'Sentiment', 'Compound_Sentiment'])
-        
-        # If sentiment analysis hasn't been done, do it now
-        if df['Sentiment'].isnull().all():
-            cybersecurity_sia = CybersecuritySentimentAnalyzer()
-            df['Sentiment'] = df['Message'].apply(cybersecurity_sia.polarity_scores)
-            df['Compound_Sentiment'] = df['Sentiment'].apply(lambda x: x['compound'] if isinstance(x, dict) else None)
-        
-        batch_filename = f"telegram_scraped_messages_batch_{batch_counter}.csv"
-        df.to_csv(batch_filename, index=False)
-        print_success(f"Saved batch {batch_counter} with {len(batch)} messages to {batch_filename}")
-    else:
-        print_info(f"No messages in the current batch.")
+    # Score a whole batch in one call, returning an (n, 4) float array in SENTIMENT_FIELDS order.
+    # Spam channels repost the same text over and over, so scores are memoized in a bounded LRU
+    # keyed by a hash of the text rather than the text itself.
+    def score_batch(self, texts):
+        scores = np.empty((len(texts), len(SENTIMENT_FIELDS)))
+        cache = self.score_cache
+        for i, text in enumerate(texts):
+            key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+            row = cache.get(key)
+            if row is None:
+                polarity = self.sia.polarity_scores(text)
+                row = cache[key] = tuple(polarity[field] for field in SENTIMENT_FIELDS)
+                if len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+            else:
+                cache.move_to_end(key)
+            scores[i] = row
+        return scores
+
+    def compound_scores(self, texts):
+        return self.score_batch(texts)[:, SENTIMENT_FIELDS.index('compound')]
 
-# generate sentiment report
-def generate_sentiment_report(df):
+# keyboard interrupt (Ctrl+C), cancels the crawl so run_scraper can save its batch and crawl state on the way out
+def install_interrupt_handler(task):
+    loop = asyncio.get_running_loop()
     try:
-        # Ensure Compound_Sentiment is float
-        df['Compound_Sentiment'] = pd.to_numeric(df['Compound_Sentiment'], errors='coerce')
-        
-        # Calculate average sentiment scores
-        avg_sentiment = pd.DataFrame(df['Sentiment'].dropna().tolist()).mean()
-        
-        # Categorise messages based on compound sentiment
-        df['Sentiment_Category'] = df['Compound_Sentiment'].apply(lambda x: 
-            'High Alert' if x <= -0.5 else
-            'Potential Threat' if -0.5 < x <= -0.1 else
-            'Neutral' if -0.1 < x < 0.1 else
-            'Potentially Positive' if 0.1 <= x < 0.5 else
-            'Very Positive'
-        )
-        sentiment_counts = df['Sentiment_Category'].value_counts()
-        total_messages = len(df)
+        loop.add_signal_handler(signal.SIGINT, task.cancel)
+    except NotImplementedError:
+        signal.signal(signal.SIGINT, lambda sig, frame: loop.call_soon_threadsafe(task.cancel))
+
+# Report categories with their descriptions, in report order
+SENTIMENT_CATEGORIES = [
+    ('High Alert', "Severe Threats"),
+    ('Potential Threat', "Potential Threats"),
+    ('Neutral', "Neutral Messages"),
+    ('Potentially Positive', "Potentially Positive"),
+    ('Very Positive', "Strong Security Indicators")
+]
+
+# Sentiment report statistics kept online as batches are saved: running sums for the averages,
+# category counters and bounded heaps for the top messages. Memory doesn't grow with the corpus.
+class SentimentReport:
+    def __init__(self, top_n=5):
+        self.top_n = top_n
+        self.total_messages = 0
+        self.sentiment_sums = np.zeros(len(SENTIMENT_FIELDS))
+        self.scored_messages = 0
+        self.category_counts = dict.fromkeys((category for category, _ in SENTIMENT_CATEGORIES), 0)
+        # Heap items are (key, text) with the weakest entry on top: keys are (-compound, -sequence)
+        # for the most concerning and (compound, -sequence) for the most positive, the sequence
+        # makes earlier messages win ties like DataFrame.nsmallest/nlargest do
+        self.most_concerning = []
+        self.most_positive = []
+        self.sequence = 0
+
+    # texts: message texts, scores: (n, 4) array in SENTIMENT_FIELDS order (NaN rows for unscored
+    # messages), compounds: compound scores used for categories and rankings, defaults to the scores' own
+    def update(self, texts, scores, compounds=None):
+        compounds = scores[:, SENTIMENT_FIELDS.index('compound')] if compounds is None else np.asarray(compounds, dtype=float)
+        self.total_messages += len(texts)
+
+        scored = ~np.isnan(scores).any(axis=1)
+        self.sentiment_sums += scores[scored].sum(axis=0)
+        self.scored_messages += int(scored.sum())
+
+        # Same thresholds as the original per-row lambda, which sends NaN to 'Very Positive'
+        counts = {
+            'High Alert': int((compounds <= -0.5).sum()),
+            'Potential Threat': int(((compounds > -0.5) & (compounds <= -0.1)).sum()),
+            'Neutral': int(((compounds > -0.1) & (compounds < 0.1)).sum()),
+            'Potentially Positive': int(((compounds >= 0.1) & (compounds < 0.5)).sum()),
+        }
+        counts['Very Positive'] = len(texts) - sum(counts.values())
+        for category, count in counts.items():
+            self.category_counts[category] += count
+
+        # Only a batch's own top candidates can make it into the overall top
+        valid = np.flatnonzero(~np.isnan(compounds))
+        for i in valid[np.lexsort((valid, compounds[valid]))][:self.top_n]:
+            self.push(self.most_concerning, (-compounds[i], -(self.sequence + i)), texts[i])
+        for i in valid[np.lexsort((valid, -compounds[valid]))][:self.top_n]:
+            self.push(self.most_positive, (compounds[i], -(self.sequence + i)), texts[i])
+        self.sequence += len(texts)
+
+    def push(self, heap, key, text):
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, (key, text[:100]))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, text[:100]))
+
+    # Test and benchmark helper: feeds DataFrames in the old all_messages_df layout (Message, Sentiment
+    # dicts, Compound_Sentiment) so the streamed report can be compared with the whole-corpus one.
+    # The crawl itself calls update() with the score arrays
+    def update_from_dataframe(self, df):
+        sentiments = df['Sentiment'].tolist()
+        scores = np.array([
+            [sentiment[field] for field in SENTIMENT_FIELDS] if isinstance(sentiment, dict) else [np.nan] * len(SENTIMENT_FIELDS)
+            for sentiment in sentiments
+        ]).reshape(len(sentiments), len(SENTIMENT_FIELDS))
+        compounds = pd.to_numeric(df['Compound_Sentiment'], errors='coerce').to_numpy(dtype=float)
+        self.update(df['Message'].tolist(), scores, compounds)
+
+    # Top messages as (compound, text), most extreme first
+    def top_messages(self, heap, sign):
+        return [(sign * key[0], text) for key, text in sorted(heap, reverse=True)]
+
+    def write(self, path='sentiment_report.txt'):
+        total_messages = self.total_messages
+        avg_sentiment = dict(zip(SENTIMENT_FIELDS, self.sentiment_sums / self.scored_messages)) if self.scored_messages else {}
 
         # Calculate overall sentiment score
         overall_score = avg_sentiment.get('compound', 0) * 100
@@ -325,47 +1639,35 @@ Interpretation:
 Message Sentiment Breakdown:
 """
 
-        categories = [
-            ('High Alert', "Severe Threats"),
-            ('Potential Threat', "Potential Threats"),
-            ('Neutral', "Neutral Messages"),
-            ('Potentially Positive', "Potentially Positive"),
-            ('Very Positive', "Strong Security Indicators")
-        ]
-
-        for category, description in categories:
-            count = sentiment_counts.get(category, 0)
+        for category, description in SENTIMENT_CATEGORIES:
+            count = self.category_counts[category]
             percentage = (count / total_messages) * 100
             report += f"{category} ({description}): {count} messages ({percentage:.1f}%)\n"
 
         report += f"\nTop 5 Most Concerning Messages (Potential Threats):\n"
 
-        for _, row in df.nsmallest(5, 'Compound_Sentiment').iterrows():
-            threat_level = abs(row['Compound_Sentiment']) * 100
-            report += f"- {row['Message'][:100]}... (Threat Level: {threat_level:.1f}/100)\n"
+        for compound, message in self.top_messages(self.most_concerning, -1):
+            threat_level = abs(compound) * 100
+            report += f"- {message}... (Threat Level: {threat_level:.1f}/100)\n"
 
         report += f"\nTop 5 Most Positive Messages (Potential Security Improvements):\n"
 
-        for _, row in df.nlargest(5, 'Compound_Sentiment').iterrows():
-            positivity_level = row['Compound_Sentiment'] * 100
-            report += f"- {row['Message'][:100]}... (Positivity Level: {positivity_level:.1f}/100)\n"
+        for compound, message in self.top_messages(self.most_positive, 1):
+            positivity_level = compound * 100
+            report += f"- {message}... (Positivity Level: {positivity_level:.1f}/100)\n"
 
-        with open('sentiment_report.txt', 'w', encoding='utf-8') as f:
+        with open(path, 'w', encoding='utf-8') as f:
             f.write(report)
 
-        print_success("Sentiment analysis report generated and saved to 'sentiment_report.txt'")
+        print_success(f"Sentiment analysis report generated and saved to '{path}'")
         
         # Print the sentiment category counts to the console with colors
         print_info("Sentiment Category Counts:")
-        for category, description in categories:
-            count = sentiment_counts.get(category, 0)
+        for category, description in SENTIMENT_CATEGORIES:
+            count = self.category_counts[category]
             percentage = (count / total_messages) * 100
             color = get_category_color(category)
-            print(f"{color}{category}: {count} ({percentage:.1f}%){Style.RESET_ALL}")
-
-    except Exception as e:
-        print_error(f"Error generating sentiment report: {e}")
-        print_error(f"DataFrame info:\n{df.info()}")
+            print_detail(f"{color}{category}: {count} ({percentage:.1f}%){Style.RESET_ALL}")
 
 def get_category_color(category):
     color_map = {
@@ -389,266 +1691,1400 @@ def interpret_overall_score(score):
     else:
         return "Very positive situation. Strong security indicators present. Continue current security practices and look for areas of improvement."
 
-def analyze_sentiment(cybersecurity_sia, message):
-    return cybersecurity_sia.polarity_scores(message)
+# One analyzer per process, built on first use: the crawler's scoring thread and each sentiment
+# worker share it (and its score cache) across every batch
+shared_sia = None
 
-def process_messages(messages, num_processes=multiprocessing.cpu_count()):
-    df = pd.DataFrame(messages, columns=['Sender ID', 'Date', 'Message', 'Sentiment', 'Compound_Sentiment'])
-    
-    cybersecurity_sia = CybersecuritySentimentAnalyzer()
-    
-    # Parallelize sentiment analysis
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        partial_analyze = partial(analyze_sentiment, cybersecurity_sia)
-        df['Sentiment'] = pool.map(partial_analyze, df['Message'])
-    
-    df['Compound_Sentiment'] = df['Sentiment'].apply(lambda x: x['compound'])
-    
-    generate_sentiment_report(df)
-    return df
+def get_sentiment_analyzer():
+    global shared_sia
+    if shared_sia is None:
+        shared_sia = CybersecuritySentimentAnalyzer()
+    return shared_sia
+
+def init_sentiment_worker():
+    # Ctrl+C is handled by the crawler, which still needs the pool to score its last batch
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    get_sentiment_analyzer()
+
+def score_texts(texts):
+    return get_sentiment_analyzer().score_batch(texts)
+
+def create_sentiment_pool(workers):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # Build the lexicon cache here when it is missing, rather than in every worker at once
+    if not os.path.exists(lexicon_cache_path()):
+        load_lexicon()
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_sentiment_worker)
 
 async def get_entity_name(entity):
-    if isinstance(entity, User):
+    if isinstance(entity, CachedEntity):
+        return entity.name
+    elif isinstance(entity, types.User):
         return f"@{entity.username}" if entity.username else f"User({entity.id})"
-    elif isinstance(entity, (Channel, Chat)):
+    elif isinstance(entity, (types.Channel, types.Chat)):
         return entity.title or f"Channel({entity.id})"
     else:
         return f"Unknown({type(entity).__name__})"
 
-async def scrape_messages(client, entity, message_limit, keywords, channel_manager, affiliated_channel=None):
+@timed_metric('telehunting_scrape_messages_seconds')
+async def scrape_messages(client, entity, message_limit, keywords, channel_manager, affiliated_channel=None, rate_limiter=None, checkpoints=None, backfill=False, depth=0, keywords_only=False, batch_processor=None, history_client=None, max_retries=5):
     messages = []
-    try:
-        entity_name = await get_entity_name(entity)
-        async for message in client.iter_messages(entity, limit=message_limit):
-            if message.text:
+    rate_limiter = rate_limiter or RateLimiter()
+    # A takeout session fetches the same history under its own, much looser limits
+    history_client = history_client or client
+    request_class = 'history' if history_client is client else 'takeout'
+    entity_name = await get_entity_name(entity)
+    peer = entity.input_peer if isinstance(entity, CachedEntity) else entity
+    peer_id = entity.peer_id if isinstance(entity, CachedEntity) else entity.id
+    checkpoint = checkpoints.get(peer_id) if checkpoints else None
+    fetched_total = 0
+    matcher = keywords if isinstance(keywords, KeywordMatcher) else KeywordMatcher(keywords or [])
+    keyword_hits = 0
+    discovered_links = {}
+    linked = set()  # discovered links seen at least once as more than an @mention
+    flood_waits = 0
+    started = time.monotonic()
+
+    # Everything per page of history rather than per message: one link scan over the page, and its
+    # records go to the batch processor together (or are returned when there is none). Each page moves
+    # the checkpoint over its ids once the batch processor has saved it, so a scrape cut short by an
+    # error or an interrupt keeps what was saved and nothing more.
+    async def process_page(page):
+        nonlocal fetched_total, keyword_hits
+        if not page:
+            return
+        fetched_total += len(page)
+        ids = [message.id for message in page]
+        page_range = (peer_id, max(ids), min(ids))
+        page = [message for message in page if message.text]
+        records = []
+        for message in page:
+            hits = matcher.match(message.text)
+            if hits:
+                keyword_hits += 1
+            # Non-matching messages still feed link discovery, but are dropped before scoring and storage
+            if keywords_only and not hits:
+                continue
+            # Echoing every message is debug output, the line isn't even built otherwise
+            if logger.isEnabledFor(logging.DEBUG):
                 if affiliated_channel:
-                    print_info(f"Message from {Fore.CYAN}{Style.BRIGHT}{entity_name}{Style.RESET_ALL}.{Fore.YELLOW}{Style.BRIGHT} <-- {affiliated_channel}{Style.RESET_ALL}: {message.text}")
+                    print_debug(f"Message from {Fore.CYAN}{Style.BRIGHT}{entity_name}{Style.RESET_ALL}.{Fore.YELLOW}{Style.BRIGHT} <-- {affiliated_channel}{Style.RESET_ALL}: {message.text}")
                 else:
-                    print_info(f"Message from {Fore.CYAN}{Style.BRIGHT}{entity_name}{Style.RESET_ALL}: {message.text}")
-                messages.append([message.sender_id, message.date, message.text, None, None])
-                
-                # Process t.me links in the message
-                links = extract_channel_links(message.text)
-                for link in links:
-                    channel_manager.add_channel(link, source_channel=entity_name)
-            
-            await asyncio.sleep(0.1)
-    except FloodWaitError as e:
-        print_warning(f"FloodWaitError in scrape_messages: {e}")
-        await asyncio.sleep(min(e.seconds, 30))
+                    print_debug(f"Message from {Fore.CYAN}{Style.BRIGHT}{entity_name}{Style.RESET_ALL}: {message.text}")
+            records.append(MessageRecord(message.sender_id, message.date, message.text, hits, forward_origin(message)))
+
+        # Links found on the page count as mentioned at its newest message
+        dates = [message.date for message in page if message.date]
+        seen_at = max(dates).timestamp() if dates else None
+        if page:
+            mentions = set()
+            for link in extract_page_links(page, mentions):
+                discovered_links[link] = max(seen_at or 0, discovered_links.get(link) or 0) or None
+                if link not in mentions:
+                    linked.add(link)
+
+        if batch_processor:
+            batch_processor.add_indicators(page, entity_name)
+            await batch_processor.add_messages(records, entity_name, affiliated_channel, peer_id,
+                                               on_written=(lambda: checkpoints.update(*page_range)) if checkpoints else None)
+        else:
+            messages.extend(records)
+            if checkpoints:
+                checkpoints.update(*page_range)
+
+    try:
+        for reverse, offset_id in plan_history(checkpoint, backfill):
+            fetched = 0
+            while fetched < message_limit:
+                page = []
+                try:
+                    await rate_limiter.acquire(request_class)
+                    # offset_id moves with every message, so a pass cut short by a FloodWait resumes where it stopped.
+                    # Pacing is left to the rate limiter, which backs off on FloodWaits, so Telethon's own fixed
+                    # wait between pages (a second per page past 3000 messages) is turned off.
+                    if reverse:
+                        history = history_client.iter_messages(peer, limit=message_limit - fetched, min_id=offset_id, reverse=True, wait_time=0)
+                    else:
+                        history = history_client.iter_messages(peer, limit=message_limit - fetched, offset_id=offset_id, wait_time=0)
+                    async for message in history:
+                        page.append(message)
+                        fetched += 1
+                        offset_id = message.id
+                        # iter_messages fetches history in pages of 100, take a token before the next page goes out
+                        if len(page) == 100:
+                            await process_page(page)
+                            page = []
+                            await rate_limiter.acquire(request_class)
+                    await process_page(page)
+                    break
+                except errors.FloodWaitError as e:
+                    await process_page(page)
+                    rate_limiter.report_flood_wait(request_class, e.seconds)
+                    if flood_waits >= max_retries:
+                        print_warning(f"Giving up on {entity_name} after {max_retries} FloodWaits")
+                        raise
+                    flood_waits += 1
+                    print_warning(f"FloodWaitError in scrape_messages, resuming {entity_name} after {e.seconds} seconds (Attempt {flood_waits}/{max_retries})")
     except Exception as e:
         print_error(f"Error scraping entity {entity_name}: {e}")
+    finally:
+        # Links found on pages already handed to the batch processor are kept when the crawl is interrupted.
+        # They only add to the frontier, the channel itself is scraped again on resume from its checkpoint.
+        keyword_density = keyword_hits / fetched_total if fetched_total else 0.0
+        for link, seen_at in discovered_links.items():
+            channel_manager.add_channel(link, source_channel=entity_name, depth=depth + 1, keyword_density=keyword_density, seen_at=seen_at, mention=link not in linked)
+        
+        metrics.inc('telehunting_messages_fetched_total', fetched_total)
+        metrics.inc('telehunting_keyword_hits_total', keyword_hits)
+    elapsed = max(time.monotonic() - started, 1e-9)
+    if fetched_total:
+        print_info(f"{entity_name}: {fetched_total:,} messages in {elapsed:.1f}s ({fetched_total / elapsed:,.0f} msgs/s)",
+                   channel=entity_name, messages=fetched_total, seconds=elapsed, msgs_per_s=fetched_total / elapsed)
     
     return messages, entity_name
 
-async def process_channels(client, channel_manager, message_depth, keywords, batch_processor):
-    while channel_manager.has_unprocessed_channels():
-        link = channel_manager.get_next_channel()
-        affiliated_channel = channel_manager.get_affiliation(link)
-        try:
-            join_success = await retry_with_backoff(join_channel(client, channel_manager, link))
-            if join_success:
-                entity = await client.get_entity(link)
-                entity_messages, channel_name = await scrape_messages(client, entity, message_depth, keywords, channel_manager, affiliated_channel)
-                
-                # Add messages to batch processor with channel name and affiliation
-                batch_processor.add_messages(entity_messages, channel_name, affiliated_channel)
-            else:
-                print_warning(f"Skipping entity {link} due to joining failure")
-        except Exception as e:
-            print_error(f"Failed to process entity {link}: {e}")
-        finally:
-            channel_manager.mark_as_processed(link)
-        
-        await asyncio.sleep(1)  # Small delay between processing channels
-
-async def process_single_channel(client, channel_manager, link, message_depth, keywords):
+async def process_channel(client, channel_manager, link, message_depth, keywords, batch_processor, rate_limiter, entity_cache=None, checkpoints=None, backfill=False, keywords_only=False, memberships=None, history_client=None):
+    affiliated_channel = channel_manager.get_affiliation(link)
     try:
-        join_success = await retry_with_backoff(join_channel(client, channel_manager, link))
-        if join_success:
-            entity = await client.get_entity(link)
-            entity_name = await get_entity_name(entity)
-            print_info(f"Scraping messages from: {entity_name}")
-            entity_messages = await scrape_messages(client, entity, message_depth, keywords, channel_manager)
-            return entity_messages
+        # join_channel handles FloodWaits itself, through the account's rate limiter
+        entity = await join_channel(client, channel_manager, link, rate_limiter=rate_limiter, entity_cache=entity_cache, memberships=memberships)
+        if entity:
+            # Each page of history goes to the batch processor as soon as it is fetched
+            try:
+                await scrape_messages(client, entity, message_depth, keywords, channel_manager, affiliated_channel, rate_limiter=rate_limiter, checkpoints=checkpoints, backfill=backfill, depth=channel_manager.get_depth(link), keywords_only=keywords_only, batch_processor=batch_processor, history_client=history_client)
+            finally:
+                if memberships is not None:
+                    memberships.release(entity)
         else:
             print_warning(f"Skipping entity {link} due to joining failure")
     except Exception as e:
         print_error(f"Failed to process entity {link}: {e}")
-    return []
-
-async def retry_with_backoff(coroutine, max_retries=5, base_delay=1, max_delay=60):
-    retries = 0
-    while True:
+    # Not in a finally: a channel cut off by an interrupt stays unprocessed and is picked up again on resume
+    channel_manager.mark_as_processed(link)
+    await batch_processor.add_messages([], None, None, on_written=lambda: channel_manager.save_processed(link))
+
+# Periodic one-line progress for a BFS level (rates and ETA), in place of echoing every message
+class ProgressReporter:
+    def __init__(self, label, total, channel_manager, batch_processor, interval=10):
+        self.label = label
+        self.total = total
+        self.channel_manager = channel_manager
+        self.batch_processor = batch_processor
+        self.interval = interval
+        self.started = time.monotonic()
+        self.processed_before = len(channel_manager.processed_channels)
+        self.messages_before = batch_processor.received_messages
+
+    def progress(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        channels = len(self.channel_manager.processed_channels) - self.processed_before
+        messages = self.batch_processor.received_messages - self.messages_before
+        return elapsed, channels, messages
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            elapsed, channels, messages = self.progress()
+            channel_rate = channels / elapsed
+            remaining = max(0, self.total - channels)
+            eta = f"{remaining / channel_rate:.0f}s" if channel_rate else "unknown"
+            print_info(f"{self.label}: {channels}/{self.total} channels ({channel_rate:.2f}/s), {messages:,} messages ({messages / elapsed:,.0f}/s), ETA {eta}",
+                       channels=channels, total=self.total, messages=messages, channels_per_s=channel_rate, msgs_per_s=messages / elapsed)
+
+    def summary(self):
+        elapsed, channels, messages = self.progress()
+        print_success(f"{self.label} done: {channels} channels, {messages:,} messages in {elapsed:.1f}s ({messages / elapsed:,.0f} msgs/s)",
+                      channels=channels, messages=messages, seconds=elapsed)
+
+# Drain the frontier (or one BFS level of it) with a bounded pool of workers per account. Every account
+# pulls from the same frontier, so the work splits itself by how fast each account gets through it.
+async def process_channels(client, channel_manager, message_depth, keywords, batch_processor, concurrency=1, rate_limiter=None, entity_cache=None, checkpoints=None, backfill=False, depth=None, keywords_only=False, accounts=None):
+    if not accounts:
+        account = Account(None, client)
+        account.rate_limiter = rate_limiter or RateLimiter()
+        account.entity_cache = entity_cache
+        accounts = [account]
+    in_flight = 0
+    changed = asyncio.Condition()
+
+    async def worker(account):
+        nonlocal in_flight
+        while True:
+            async with changed:
+                while True:
+                    # An empty frontier only means we're done once nobody is still scraping (and adding links)
+                    while not channel_manager.has_unprocessed_channels(depth) and in_flight:
+                        await changed.wait()
+                    if not channel_manager.has_unprocessed_channels(depth):
+                        changed.notify_all()
+                        return
+                    # An account whose resolve or history reads are flood-waited sits out while the others keep
+                    # pulling channels, until its pause is over or the crawl finishes without it. A paused join
+                    # class doesn't bench it, join_channel reads without joining meanwhile.
+                    pause = account.rate_limiter.paused_for('resolve', 'takeout' if account.history_client else 'history')
+                    if not pause:
+                        break
+                    try:
+                        await asyncio.wait_for(changed.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                link = channel_manager.get_next_channel(depth)
+                in_flight += 1
+            try:
+                await process_channel(account.client, channel_manager, link, message_depth, keywords, batch_processor, account.rate_limiter, account.entity_cache, checkpoints, backfill, keywords_only, account.memberships, account.history_client)
+            finally:
+                async with changed:
+                    in_flight -= 1
+                    changed.notify_all()
+
+    await asyncio.gather(*(worker(account) for account in accounts for _ in range(max(1, concurrency))))
+
+# Watch the channels we already joined through update handlers, so keeping up with them costs no history requests.
+# New messages go through the same keyword, link discovery and sentiment path as crawled ones.
+# Each channel is watched by one account that is a member of it. Links found along the way are crawled
+# between flushes down to channel_depth, and the channels joined for them are watched from then on.
+async def monitor_channels(accounts, channel_manager, keywords, batch_processor, checkpoints=None, keywords_only=False, flush_interval=30, message_depth=1000, channel_depth=0, concurrency=1):
+    channels = {}  # peer_id -> (link, entity, account watching it)
+    watched = {account.name: [] for account in accounts}
+    seen_links = set()
+    latest = {}  # peer_id -> newest message id handed to the batch processor, known from checkpoints or live
+    pending = {}  # peer_id -> live messages held back while the channel's history catches up
+    handlers = {}  # account name -> registered NewMessage filter
+    catch_ups = set()
+    
+    # Channels crawled or joined since the last call, watched by the first account that is a member
+    def select_channels():
+        added = 0
+        unwatched = []
+        for link in (channel_manager.joined_channels | channel_manager.processed_channels) - seen_links:
+            seen_links.add(link)
+            holders = []
+            for account in accounts:
+                entity = account.entity_cache.get(link)
+                if isinstance(entity, CachedEntity) and entity.type in ('channel', 'chat'):
+                    holders.append((account, entity))
+            # Updates only arrive at an account that is a member. Accounts without a membership manager joined
+            # every channel they scraped.
+            members = [(account, entity) for account, entity in holders if account.memberships is None or entity.peer_id in account.memberships]
+            if holders and not members:
+                unwatched.append(link)
+            for account, entity in members[:1]:
+                if entity.peer_id not in channels:
+                    channels[entity.peer_id] = (link, entity, account)
+                    watched[account.name].append(entity.input_peer)
+                    checkpoint = checkpoints.get(entity.peer_id) if checkpoints else None
+                    if checkpoint:
+                        latest[entity.peer_id] = checkpoint[0]
+                    added += 1
+        if unwatched:
+            print_warning(f"Not monitoring {len(unwatched)} channels that were read without joining, no updates arrive from them")
+            print_debug(f"Channels read without joining: {', '.join(sorted(unwatched))}")
+        return added
+    
+    # One handler per account, registered again with the grown chat list when channels are added
+    def subscribe():
+        for account in accounts:
+            if not watched[account.name]:
+                continue
+            if account.name in handlers:
+                account.client.remove_event_handler(on_new_message, handlers[account.name])
+            handlers[account.name] = events.NewMessage(chats=list(watched[account.name]))
+            account.client.add_event_handler(on_new_message, handlers[account.name])
+    
+    matcher = keywords if isinstance(keywords, KeywordMatcher) else KeywordMatcher(keywords or [])
+    activity = {}  # peer_id -> [messages seen, keyword hits], for the density of links found live
+    active = set()  # peer_ids with new messages since the last flush
+    
+    async def on_new_message(event):
+        message = event.message
+        peer_id = utils.get_peer_id(message.peer_id, add_mark=False)
+        if peer_id not in channels or not message.text:
+            return
+        if peer_id in pending:
+            pending[peer_id].append(message)
+            return
+        # Messages posted while nobody was watching (before monitoring started, or while updates didn't come
+        # through) are fetched from history first, so the checkpoint never moves over them
+        if checkpoints and peer_id in latest and message.id > latest[peer_id] + 1:
+            pending[peer_id] = [message]
+            task = asyncio.create_task(catch_up(peer_id))
+            catch_ups.add(task)
+            task.add_done_callback(catch_ups.discard)
+            return
+        await handle_message(peer_id, message)
+    
+    async def handle_message(peer_id, message):
+        link, entity, _ = channels[peer_id]
+        latest[peer_id] = max(latest.get(peer_id, 0), message.id)
+        active.add(peer_id)
+        hits = matcher.match(message.text)
+        counts = activity.setdefault(peer_id, [0, 0])
+        counts[0] += 1
+        counts[1] += bool(hits)
+        
+        seen_at = message.date.timestamp() if message.date else None
+        mentions = set()
+        for new_link in extract_message_links(message, mentions):
+            if clean_link(new_link) not in channel_manager.channel_depths:
+                print_info(f"Discovered {new_link} in {entity.name}")
+            channel_manager.add_channel(new_link, source_channel=entity.name, depth=channel_manager.get_depth(link) + 1,
+                                        keyword_density=counts[1] / counts[0], seen_at=seen_at, mention=new_link in mentions)
+        batch_processor.add_indicators([message], entity.name)
+        
+        # The checkpoint moves past the message once it is saved, or right away when keyword filtering drops it
+        records = []
+        if hits or not keywords_only:
+            print_debug(f"New message in {Fore.CYAN}{Style.BRIGHT}{entity.name}{Style.RESET_ALL}: {message.text}")
+            records.append(MessageRecord(message.sender_id, message.date, message.text, hits, forward_origin(message)))
+        await batch_processor.add_messages(records, entity.name, channel_manager.get_affiliation(link), peer_id,
+                                           on_written=(lambda: checkpoints.update(peer_id, message.id, message.id)) if checkpoints else None)
+    
+    # Page through the history above the saved checkpoint until it reaches the held back live messages (or
+    # history has nothing more, the gap was deleted messages), then let through the ones history didn't cover
+    async def catch_up(peer_id):
+        link, entity, account = channels[peer_id]
         try:
-            return await coroutine
-        except FloodWaitError as e:
-            if retries >= max_retries:
-                raise
-            delay = min(base_delay * (2 ** retries) + random.uniform(0, 1), max_delay)
-            print_warning(f"FloodWaitError encountered. Retrying in {delay:.2f} seconds. (Attempt {retries + 1}/{max_retries})")
-            await asyncio.sleep(delay)
-            retries += 1
+            checked = None
+            while True:
+                await batch_processor.flush()
+                checkpoint = checkpoints.get(peer_id)
+                if checkpoint is None or checkpoint == checked or checkpoint[0] + 1 >= min(message.id for message in pending[peer_id]):
+                    break
+                checked = checkpoint
+                await scrape_messages(account.client, entity, message_depth, matcher, channel_manager, channel_manager.get_affiliation(link),
+                                      rate_limiter=account.rate_limiter, checkpoints=checkpoints, depth=channel_manager.get_depth(link),
+                                      keywords_only=keywords_only, batch_processor=batch_processor, history_client=account.history_client)
+            newest = checkpoint[0] if checkpoint else 0
+            latest[peer_id] = max(latest.get(peer_id, 0), newest)
+            for message in pending.pop(peer_id):
+                if message.id > newest:
+                    await handle_message(peer_id, message)
         except Exception as e:
-            print_error(f"Unexpected error: {e}")
-            raise
+            pending.pop(peer_id, None)
+            print_error(f"Failed to catch up with {entity.name}: {e}")
+    
+    select_channels()
+    if not channels:
+        print_warning("No joined channels to monitor")
+        return
+    subscribe()
+    print_header(f"Monitoring {len(channels)} channels for new messages, press Ctrl+C to stop")
+    reported = 0
+    crawl = None
+    try:
+        while True:
+            await asyncio.sleep(flush_interval)
+            received = sum(counts[0] for counts in activity.values())
+            if received > reported:
+                print_info(f"Monitor: {received - reported} new messages in {len(active)} channels", new_messages=received - reported, channels=len(active))
+                reported = received
+            active.clear()
+            # Buffered messages are scored and written without waiting for a full batch. flush returns once
+            # they are saved, their checkpoints moved and the crawl state committed.
+            await batch_processor.flush()
+            
+            # One BFS level of the links found so far at a time, alongside the live updates
+            if crawl and crawl.done():
+                await crawl
+                crawl = None
+                added = select_channels()
+                if added:
+                    subscribe()
+                    print_info(f"Monitoring {added} more channels, {len(channels)} in total")
+            depth = channel_manager.min_pending_depth()
+            if not crawl and depth < channel_depth and channel_manager.has_unprocessed_channels(depth):
+                print_subheader(f"Crawling {channel_manager.discovered_channels.pending(depth)} channels found while monitoring (depth {depth + 1}/{channel_depth})")
+                crawl = asyncio.create_task(process_channels(None, channel_manager, message_depth, matcher, batch_processor, concurrency=concurrency,
+                                                             checkpoints=checkpoints, depth=depth, keywords_only=keywords_only, accounts=accounts))
+    except asyncio.CancelledError:
+        print_warning("Monitoring stopped")
+    finally:
+        for task in [crawl, *catch_ups]:
+            if task:
+                task.cancel()
+        for account in accounts:
+            if account.name in handlers:
+                account.client.remove_event_handler(on_new_message, handlers[account.name])
+
+async def aenumerate(iterable, start=0):
+    index = start
+    async for item in iterable:
+        yield index, item
+        index += 1
+
+# Columns of the legacy CSV batch files
+CSV_COLUMNS = ['Sender ID', 'Date', 'Message', 'Sentiment', 'Compound_Sentiment', 'Channel Name', 'Affiliated Channel', 'Keywords']
+
+# Columns of a scored batch as it is handed to the sinks
+RECORD_COLUMNS = ['Sender ID', 'Date', 'Message', 'Sentiment', 'Compound_Sentiment', 'Keywords', 'Forward Origin', 'Channel Name', 'Affiliated Channel', 'Channel ID']
+
+# A scraped message on its way to the batch pipeline, sentiment is only added to the batch's columns
+class MessageRecord:
+    __slots__ = ('sender_id', 'date', 'text', 'keywords', 'forward_origin')
+
+    def __init__(self, sender_id, date, text, keywords=(), forward_origin=None):
+        self.sender_id = sender_id
+        self.date = date
+        self.text = text
+        self.keywords = keywords
+        self.forward_origin = forward_origin
+
+# Messages waiting to be scored, kept column by column. Every message of a channel shares its name,
+# affiliation and id, so rows only hold a small integer into the interned channel table, which
+# lives as long as the batch processor so codes stay stable from batch to batch.
+class RecordBatch:
+    def __init__(self, channels=None):
+        self.channels = {} if channels is None else channels  # (name, affiliation, id) -> code
+        self.clear()
+
+    def clear(self):
+        self.sender_ids = []
+        self.dates = []
+        self.texts = []
+        self.keywords = []
+        self.forward_origins = []
+        self.channel_codes = array('i')
+
+    def __len__(self):
+        return len(self.texts)
+
+    def extend(self, messages, channel_name, affiliated_channel, channel_id):
+        code = self.channels.setdefault((channel_name, affiliated_channel, channel_id), len(self.channels))
+        for message in messages:
+            self.sender_ids.append(message.sender_id)
+            self.dates.append(message.date)
+            self.texts.append(message.text)
+            self.keywords.append(message.keywords)
+            self.forward_origins.append(message.forward_origin)
+        self.channel_codes.extend(itertools.repeat(code, len(messages)))
+
+    # The buffered rows as the DataFrame the sinks expect, built column by column
+    def to_dataframe(self):
+        codes = np.frombuffer(self.channel_codes, dtype=np.int32) if self.channel_codes else np.empty(0, dtype=np.int32)
+        channel_table = list(zip(*self.channels)) or [(), (), ()]
+        names, affiliations, channel_ids = (np.array(column, dtype=object)[codes] for column in channel_table)
+        return pd.DataFrame({
+            'Sender ID': self.sender_ids,
+            'Date': self.dates,
+            'Message': self.texts,
+            'Sentiment': None,
+            'Compound_Sentiment': None,
+            'Keywords': self.keywords,
+            'Forward Origin': self.forward_origins,
+            'Channel Name': names,
+            'Affiliated Channel': affiliations,
+            'Channel ID': channel_ids,
+        }, columns=RECORD_COLUMNS)
+
+COMPRESSION_EXTENSIONS = {'gzip': 'gz', 'bz2': 'bz2', 'zstd': 'zst', 'xz': 'xz'}
+
+# First batch number not already used by a batch file, so a resumed or repeated crawl doesn't overwrite earlier output
+def next_batch_number(output_dir, prefix):
+    numbers = [name[len(prefix):].split('.')[0] for name in os.listdir(output_dir) if name.startswith(prefix)]
+    return max((int(number) for number in numbers if number.isdigit()), default=0) + 1
+
+# One CSV file per batch, as the crawler has always written them. Sinks number the batches they write,
+# batch_counter is the number the next one gets.
+class CsvSink:
+    def __init__(self, output_dir='.', compression=None, prefix='telegram_scraped_messages_batch_'):
+        self.output_dir = output_dir
+        self.compression = compression
+        self.prefix = prefix
+        self.extension = '.csv' + (f'.{COMPRESSION_EXTENSIONS.get(compression, compression)}' if compression else '')
+        os.makedirs(output_dir, exist_ok=True)
+        self.batch_counter = next_batch_number(output_dir, prefix)
+
+    def write(self, df, scores):
+        batch_filename = os.path.join(self.output_dir, f"{self.prefix}{self.batch_counter}{self.extension}")
+        df = df.assign(Keywords=df['Keywords'].str.join('; '))
+        df.to_csv(batch_filename, index=False, columns=CSV_COLUMNS, compression=self.compression)
+        self.batch_counter += 1
+        return batch_filename
+
+    def close(self):
+        pass
+
+# Typed columnar output, pyarrow is only needed when this sink is used. A Parquet file can't be read until
+# its footer is written, so every batch is a file of its own, numbered like the CSV batches. Arrow files
+# use the IPC stream format, readable up to the last batch while still being appended to, and rotate by
+# size or age.
+class ArrowSink:
+    def __init__(self, output_dir='.', format='parquet', compression='zstd', rotate_bytes=256 * 1024 * 1024, rotate_seconds=3600, prefix='telegram_messages_batch_'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError(f"{format} output needs pyarrow, install it with 'pip install pyarrow'")
+        if format == 'arrow' and compression not in (None, 'lz4', 'zstd'):
+            raise RuntimeError(f"Arrow IPC output supports lz4 or zstd compression, not {compression}")
+        self.pa = pa
+        self.pq = pq
+        self.output_dir = output_dir
+        self.format = format
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.schema = pa.schema([
+            ('sender_id', pa.int64()),
+            ('channel_id', pa.int64()),
+            ('date', pa.timestamp('us', tz='UTC')),
+            ('message', pa.string()),
+            ('neg', pa.float32()),
+            ('neu', pa.float32()),
+            ('pos', pa.float32()),
+            ('compound', pa.float32()),
+            ('channel_name', pa.string()),
+            ('affiliated_channel', pa.string()),
+            ('keywords', pa.list_(pa.string())),
+        ])
+        self.writer = None
+        self.sink = None
+        self.path = None
+        self.opened_at = 0
+        self.prefix = prefix
+        os.makedirs(output_dir, exist_ok=True)
+        self.batch_counter = next_batch_number(output_dir, prefix) if format == 'parquet' else 1
+
+    def open(self):
+        self.opened_at = time.monotonic()
+        if self.format == 'parquet':
+            self.path = os.path.join(self.output_dir, f"{self.prefix}{self.batch_counter}.parquet")
+            self.writer = self.pq.ParquetWriter(self.path, self.schema, compression=self.compression or 'none')
+        else:
+            self.path = os.path.join(self.output_dir, f"telegram_messages_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.arrows")
+            self.sink = self.pa.OSFile(self.path, 'wb')
+            options = self.pa.ipc.IpcWriteOptions(compression=self.compression)
+            self.writer = self.pa.ipc.new_stream(self.sink, self.schema, options=options)
 
+    def due_for_rotation(self):
+        if self.rotate_seconds and time.monotonic() - self.opened_at >= self.rotate_seconds:
+            return True
+        return bool(self.rotate_bytes) and os.path.getsize(self.path) >= self.rotate_bytes
+
+    def write(self, df, scores):
+        pa = self.pa
+        if self.writer is not None and self.due_for_rotation():
+            self.close()
+        if self.writer is None:
+            self.open()
+        scores = scores.astype(np.float32)
+        columns = [
+            pa.array(pd.to_numeric(df['Sender ID'], errors='coerce'), type=pa.int64(), from_pandas=True),
+            pa.array(pd.to_numeric(df['Channel ID'], errors='coerce'), type=pa.int64(), from_pandas=True),
+            pa.array(pd.to_datetime(df['Date'], utc=True), type=pa.timestamp('us', tz='UTC'), from_pandas=True),
+            pa.array(df['Message'], type=pa.string()),
+            *(pa.array(scores[:, i]) for i in range(len(SENTIMENT_FIELDS))),
+            pa.array(df['Channel Name'], type=pa.string()),
+            pa.array(df['Affiliated Channel'], type=pa.string()),
+            pa.array(df['Keywords'], type=pa.list_(pa.string())),
+        ]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        path = self.path
+        if self.format == 'parquet':
+            self.close()
+        self.batch_counter += 1
+        return path
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            if self.sink is not None:
+                self.sink.close()
+            self.writer = None
+            self.sink = None
+
+def create_sink(output_format='csv', output_dir='.', compression=None, rotate_mb=256, rotate_minutes=60):
+    if output_format == 'csv':
+        return CsvSink(output_dir, compression)
+    return ArrowSink(output_dir, output_format, compression if compression is not None else 'zstd',
+                     rotate_bytes=int(rotate_mb * 1024 * 1024), rotate_seconds=rotate_minutes * 60)
+
+# Full-text index of every saved message in its own SQLite file. The FTS5 table only holds the
+# tokenized text and points at the messages table by rowid, which carries the columns queries filter on.
+class SearchIndex:
+    def __init__(self, path='telehunting_index.db'):
+        self.path = path
+        # Written from the writer stage's thread, one batch at a time, and searchable while a crawl runs
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                date TEXT,
+                sender_id INTEGER,
+                channel_id INTEGER,
+                channel TEXT COLLATE NOCASE,
+                affiliation TEXT,
+                compound REAL,
+                message TEXT
+            )""")
+        self.conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                message, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )""")
+        self.conn.execute('CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, date)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS messages_compound ON messages (compound)')
+        self.conn.commit()
+
+    # One transaction per saved batch
+    def add(self, df):
+        rows = [
+            (None if pd.isna(date) else date.isoformat(' ', 'seconds'), None if pd.isna(sender_id) else int(sender_id),
+             None if pd.isna(channel_id) else int(channel_id), channel, affiliation, float(compound), text)
+            for date, sender_id, channel_id, channel, affiliation, compound, text in zip(
+                df['Date'], df['Sender ID'], df['Channel ID'], df['Channel Name'], df['Affiliated Channel'], df['Compound_Sentiment'], df['Message'])
+        ]
+        with self.conn:
+            start = self.conn.execute('SELECT coalesce(max(id), 0) FROM messages').fetchone()[0] + 1
+            self.conn.executemany('INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                  [(start + i,) + row for i, row in enumerate(rows)])
+            self.conn.executemany('INSERT INTO messages_fts (rowid, message) VALUES (?, ?)',
+                                  [(start + i, row[-1]) for i, row in enumerate(rows)])
+
+    # FTS5 query syntax: "exact phrase", prefix*, AND / OR / NOT, NEAR(a b, 5)
+    def search(self, query, channel=None, min_sentiment=None, max_sentiment=None, limit=20, sort='relevance'):
+        sql = """
+            SELECT m.date, m.channel, m.affiliation, m.sender_id, m.compound,
+                   snippet(messages_fts, 0, '[', ']', '...', 24)
+            FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?"""
+        params = [query]
+        if channel:
+            sql += ' AND m.channel = ?'
+            params.append(channel)
+        if min_sentiment is not None:
+            sql += ' AND m.compound >= ?'
+            params.append(min_sentiment)
+        if max_sentiment is not None:
+            sql += ' AND m.compound <= ?'
+            params.append(max_sentiment)
+        # FTS5 walks its doclists in rowid order, so the most recently indexed matches come back without ranking every match
+        sql += ' ORDER BY rank' if sort == 'relevance' else ' ORDER BY messages_fts.rowid DESC'
+        sql += ' LIMIT ?'
+        params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def count(self):
+        return self.conn.execute('SELECT count(*) FROM messages').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+# `telehunting.py search ...`: query the index a crawl left behind
+def search_command(argv):
+    parser = argparse.ArgumentParser(prog='telehunting.py search', description='Search the full-text index of scraped messages')
+    parser.add_argument('query', help='FTS5 query: words, "exact phrase", prefix*, AND / OR / NOT, NEAR(a b, 5)')
+    parser.add_argument('--index-db', type=str, default='telehunting_index.db', help='Index written by the crawl')
+    parser.add_argument('--channel', type=str, help='Only messages from this channel')
+    parser.add_argument('--min-sentiment', type=float, help='Lowest compound sentiment to include')
+    parser.add_argument('--max-sentiment', type=float, help='Highest compound sentiment to include')
+    parser.add_argument('--sort', choices=['relevance', 'recent'], default='relevance', help='Best bm25 matches first, or the most recently indexed first (fastest for common terms)')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum number of results')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON lines')
+    args = parser.parse_args(argv)
+    setup_logging('WARNING' if args.json else 'INFO')
+
+    if not os.path.exists(args.index_db):
+        print_error(f"No search index at {args.index_db}, crawl with --index-db first")
+        return 1
+    index = SearchIndex(args.index_db)
+    try:
+        start = time.perf_counter()
+        results = index.search(args.query, args.channel, args.min_sentiment, args.max_sentiment, args.limit, args.sort)
+        elapsed = time.perf_counter() - start
+    except sqlite3.OperationalError as e:
+        print_error(f"Invalid query {args.query!r}: {e}")
+        return 1
+    finally:
+        index.close()
 
+    for date, channel, affiliation, sender_id, compound, snippet in results:
+        if args.json:
+            print(json.dumps({'date': date, 'channel': channel, 'affiliated_channel': affiliation, 'sender_id': sender_id,
+                              'compound': compound, 'snippet': snippet}, ensure_ascii=False))
+        else:
+            print_detail(f"{date}  {channel}  {compound:+.2f}  {' '.join(snippet.split())}")
+    if not args.json:
+        print_info(f"{len(results)} results in {elapsed * 1000:.1f} ms")
+    return 0
+
+# Where a forwarded channel post originally came from, so every forward of it is one message
+def forward_origin(message):
+    forward = getattr(message, 'fwd_from', None)
+    if forward is None or forward.from_id is None or forward.channel_post is None:
+        return None
+    return f"{utils.get_peer_id(forward.from_id)}:{forward.channel_post}"
+
+# Duplicate clusters in the state database with every channel each one appeared in
+class DuplicateStore:
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS duplicate_clusters (
+                cluster TEXT PRIMARY KEY,
+                text TEXT,
+                first_channel TEXT,
+                first_seen REAL,
+                copies INTEGER NOT NULL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS duplicate_channels (
+                cluster TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                copies INTEGER NOT NULL,
+                PRIMARY KEY (cluster, channel)
+            )""")
+        self.conn.commit()
+
+    # Committed along with the crawl state
+    def record(self, cluster, duplicates):
+        self.conn.execute("""
+            INSERT INTO duplicate_clusters VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(cluster) DO UPDATE SET copies = copies + excluded.copies - 1""",
+            (cluster.key, cluster.text, cluster.channel, cluster.first_seen, sum(duplicates.values()) + 1))
+        self.conn.executemany("""
+            INSERT INTO duplicate_channels VALUES (?, ?, ?)
+            ON CONFLICT(cluster, channel) DO UPDATE SET copies = copies + excluded.copies""",
+            [(cluster.key, channel, copies) for channel, copies in duplicates.items()] + [(cluster.key, cluster.channel, 0)])
+
+class DuplicateCluster:
+    __slots__ = ('key', 'text', 'channel', 'first_seen', 'signature', 'bands', 'origins')
+
+    def __init__(self, key, text, channel, signature=None, bands=()):
+        self.key = key
+        self.text = text[:200]
+        self.channel = channel
+        self.first_seen = time.time()
+        self.signature = signature
+        self.bands = bands
+        self.origins = []
+
+# Drops messages already seen in any channel: exact copies by normalized content hash or forward
+# origin, near-duplicates through MinHash signatures over word 3-gram shingles with banded LSH.
+# Only the most recent max_clusters canonical messages are remembered, which bounds memory.
+class MessageDeduplicator:
+    MERSENNE_PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, max_clusters=50000, min_words=5, store=None, seed=1):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_clusters = max_clusters
+        self.min_words = min_words
+        self.store = store
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, self.MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, self.MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.clusters = OrderedDict()  # key -> DuplicateCluster, least recently seen first
+        self.exact = {}  # content hash or forward origin -> cluster key
+        self.buckets = {}  # hash of (band, band values) -> cluster key
+        self.duplicates = 0
+
+    def signature(self, words):
+        shingles = {' '.join(words[i:i + 3]) for i in range(len(words) - 2)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8', 'surrogatepass')) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        # One universal hash (a * h + b) mod p per permutation, with a and b drawn from the whole field of
+        # p = 2**61 - 1. a * h needs up to 93 bits, so a is split at bit 32: a_lo * h fits in 64 bits and is
+        # folded below 2**61 + 8, a_hi * h stays below 2**61 and multiplying it by 2**32 mod p is a rotation of
+        # its 61 bits. The minimum of each permutation keeps its low 32 bits.
+        prime = np.uint64(self.MERSENNE_PRIME)
+        a_lo = (self.a & np.uint64(0xFFFFFFFF))[:, None]
+        a_hi = (self.a >> np.uint64(32))[:, None]
+        low = a_lo * hashes
+        low = (low & prime) + (low >> np.uint64(61))
+        high = a_hi * hashes
+        high = ((high & np.uint64((1 << 29) - 1)) << np.uint64(32)) | (high >> np.uint64(29))
+        return ((low + high + self.b[:, None]) % prime).min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signature):
+        raw = signature.tobytes()
+        step = self.rows * signature.itemsize
+        return [hash((band, raw[band * step:(band + 1) * step])) for band in range(self.bands)]
+
+    # The cluster a message belongs to, or None after registering it as a new canonical message
+    def match(self, text, origin, channel):
+        normalized = normalize_text(text)
+        words = re.findall(r'\w+', normalized)
+        content = hashlib.blake2b(' '.join(normalized.split()).encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+        for key in (origin, content):
+            if key is not None and key in self.exact:
+                return self.clusters[self.exact[key]]
+
+        signature = bands = None
+        if len(words) >= self.min_words:
+            signature = self.signature(words)
+            bands = self.band_keys(signature)
+            for band in bands:
+                cluster = self.clusters.get(self.buckets.get(band))
+                if cluster is not None and np.mean(cluster.signature == signature) >= self.threshold:
+                    self.exact[content] = cluster.key
+                    cluster.origins.append(content)
+                    if origin is not None:
+                        self.exact[origin] = cluster.key
+                        cluster.origins.append(origin)
+                    return cluster
+
+        cluster = DuplicateCluster(content, text, channel, signature, bands or ())
+        self.clusters[content] = cluster
+        self.exact[content] = content
+        cluster.origins.append(content)
+        if origin is not None:
+            self.exact[origin] = content
+            cluster.origins.append(origin)
+        for band in cluster.bands:
+            self.buckets[band] = content
+        if len(self.clusters) > self.max_clusters:
+            self.evict()
+        return None
 
+    def evict(self):
+        _, cluster = self.clusters.popitem(last=False)
+        for key in cluster.origins:
+            if self.exact.get(key) == cluster.key:
+                del self.exact[key]
+        for band in cluster.bands:
+            if self.buckets.get(band) == cluster.key:
+                del self.buckets[band]
+
+    # Canonical messages, and each duplicate counted against its cluster and channel for record()
+    def filter(self, messages, channel):
+        canonical = []
+        duplicates = {}
+        for message in messages:
+            cluster = self.match(message.text, message.forward_origin, channel)
+            if cluster is None:
+                canonical.append(message)
+                continue
+            self.clusters.move_to_end(cluster.key)
+            channels = duplicates.setdefault(cluster.key, (cluster, {}))[1]
+            channels[channel] = channels.get(channel, 0) + 1
+        self.duplicates += len(messages) - len(canonical)
+        return canonical, duplicates
+
+    def record(self, duplicates):
+        if self.store:
+            for cluster, channels in duplicates.values():
+                self.store.record(cluster, channels)
+
+    def display_stats(self):
+        print_info(f"Duplicates dropped: {self.duplicates} ({len(self.clusters)} clusters remembered)")
+
+# Indicators of compromise in the state database: one typed row per indicator with when it was first and last
+# seen (in message time) and in how many channels, and one row per channel it was seen in
+class IocStore:
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS iocs (
+                type TEXT NOT NULL,
+                value TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                first_channel TEXT,
+                sightings INTEGER NOT NULL,
+                channels INTEGER NOT NULL,
+                PRIMARY KEY (type, value)
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ioc_channels (
+                type TEXT NOT NULL,
+                value TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                sightings INTEGER NOT NULL,
+                PRIMARY KEY (type, value, channel)
+            )""")
+        self.conn.commit()
+
+    # sightings maps (type, value) to [messages, first seen, last seen] for one channel, committed along with the crawl state
+    def record(self, channel, sightings):
+        self.conn.executemany("""
+            INSERT INTO ioc_channels VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(type, value, channel) DO UPDATE SET
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen),
+                sightings = sightings + excluded.sightings""",
+            [(kind, value, channel, first_seen, last_seen, count) for (kind, value), (count, first_seen, last_seen) in sightings.items()])
+        self.conn.executemany("""
+            INSERT INTO iocs VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(type, value) DO UPDATE SET
+                first_channel = CASE WHEN excluded.first_seen < first_seen THEN excluded.first_channel ELSE first_channel END,
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen),
+                sightings = sightings + excluded.sightings,
+                channels = (SELECT COUNT(*) FROM ioc_channels WHERE ioc_channels.type = excluded.type AND ioc_channels.value = excluded.value)""",
+            [(kind, value, first_seen, last_seen, channel, count) for (kind, value), (count, first_seen, last_seen) in sightings.items()])
+
+# Pulls indicators of compromise out of a page of messages (their text, text-url entities and url buttons)
+# and counts every message an indicator appears in against the channel
+class IocExtractor:
+    def __init__(self, store=None):
+        self.store = store
+        self.counts = {}  # type -> sightings
+
+    def add(self, messages, channel):
+        texts = []
+        for message in messages:
+            text = getattr(message, 'raw_text', None) or message.text
+            urls = message_urls(message)
+            texts.append('\n'.join([text] + urls) if urls else text)
+        sightings = {}
+        for index, kind, value in extract_iocs(texts):
+            date = messages[index].date
+            seen_at = date.timestamp() if date else time.time()
+            sighting = sightings.get((kind, value))
+            if sighting is None:
+                sightings[(kind, value)] = [1, seen_at, seen_at]
+                continue
+            sighting[0] += 1
+            sighting[1] = min(sighting[1], seen_at)
+            sighting[2] = max(sighting[2], seen_at)
+        for (kind, _), (count, _, _) in sightings.items():
+            self.counts[kind] = self.counts.get(kind, 0) + count
+        if self.store and sightings:
+            self.store.record(channel, sightings)
+        return sightings
+
+    def display_stats(self):
+        by_type = ', '.join(f"{kind} {count}" for kind, count in sorted(self.counts.items(), key=lambda item: -item[1]))
+        print_info(f"Indicators of compromise: {sum(self.counts.values())} sightings" + (f" ({by_type})" if by_type else ''))
+
+# Producer/consumer pipeline: scrapers put raw messages on a bounded queue, a scoring stage batches
+# them and fans the sentiment work out to a persistent process pool, and a writer stage saves the
+# scored batches. When a stage falls behind, the full queue in front of it makes the scrapers wait.
 class BatchProcessor:
-    def __init__(self, batch_size=1000, cybersecurity_sia=None):
-        self.batch = []
-        self.batch_size = batch_size
-        self.batch_counter = 1
-        self.total_messages = 0
-        self.cybersecurity_sia = cybersecurity_sia or CybersecuritySentimentAnalyzer()
-        self.all_messages_df = pd.DataFrame(columns=['Sender ID', 'Date', 'Message', 'Sentiment', 'Compound_Sentiment', 'Channel Name', 'Affiliated Channel'])
+    FLUSH = object()  # queue marker asking the scoring stage to score a partial batch
 
-    def add_messages(self, messages, channel_name, affiliated_channel):
-        messages_with_info = [
-            message + [channel_name, affiliated_channel if affiliated_channel else "Initial Config"]
-            for message in messages
-        ]
-        self.batch.extend(messages_with_info)
-        self.total_messages += len(messages)
-        if len(self.batch) >= self.batch_size:
-            self.save_batch()
-
-    def save_batch(self):
-        if self.batch:
-            df = pd.DataFrame(self.batch, columns=['Sender ID', 'Date', 'Message', 'Sentiment', 'Compound_Sentiment', 'Channel Name', 'Affiliated Channel'])
-            df['Sentiment'] = df['Message'].apply(self.cybersecurity_sia.polarity_scores)
-            df['Compound_Sentiment'] = df['Sentiment'].apply(lambda x: x['compound']).astype(float)
-            
-            batch_filename = f"telegram_scraped_messages_batch_{self.batch_counter}.csv"
-            df.to_csv(batch_filename, index=False)
-            print_success(f"Saved batch {self.batch_counter} with {len(self.batch)} messages to {batch_filename}")
-            
-            # Ensure consistent dtypes
-            for col in df.columns:
-                if col in self.all_messages_df.columns:
-                    df[col] = df[col].astype(self.all_messages_df[col].dtype)
-            
-            self.all_messages_df = pd.concat([self.all_messages_df, df], ignore_index=True)
-            
-            self.batch = []
-            self.batch_counter += 1
+    def __init__(self, batch_size=1000, cybersecurity_sia=None, workers=0, queue_size=16, sink=None, dedup=None, index=None, iocs=None, state=None):
+        self.batch = RecordBatch()
+        self.batch_size = batch_size
+        self.sink = sink or CsvSink()
+        self.dedup = dedup
+        self.index = index
+        self.iocs = iocs
+        self.state = state  # crawl state database, committed after every saved batch
+        self.received_messages = 0  # handed over by the crawl, before deduplication
+        self.total_messages = 0  # kept after deduplication, what the sink and the report get
+        self.workers = workers
+        self.queue_size = queue_size
+        # Without worker processes, scoring runs on a thread of this process
+        self.cybersecurity_sia = cybersecurity_sia or (None if workers else get_sentiment_analyzer())
+        self.executors = []  # one single-process pool per worker, so a shard always goes to the same cache
+        self.tasks = []
+        self.report = SentimentReport()
+        self.on_written = []  # callbacks for everything handed over since the last batch went to the writer
+        self.batch_lost = False
+
+    def start(self):
+        self.message_queue = asyncio.Queue(self.queue_size)
+        self.write_queue = asyncio.Queue(2)
+        self.executors = [create_sentiment_pool(1) for _ in range(self.workers)]
+        self.tasks = [asyncio.create_task(self.score_stage()), asyncio.create_task(self.write_stage())]
+
+    # Score and write whatever is buffered without waiting for a full batch, returns once it is saved
+    async def flush(self):
+        written = asyncio.get_running_loop().create_future()
+        await self.add_messages([], None, None, on_written=written)
+        await self.put(self.FLUSH)
+        await self.wait_for(written)
+
+    # A stage that died would leave its callers waiting on a queue or future forever, its exception is raised instead
+    def check_stages(self):
+        for task in self.tasks:
+            if task.done() and not task.cancelled() and task.exception():
+                raise task.exception()
+
+    async def wait_for(self, awaitable):
+        waiter = asyncio.ensure_future(awaitable)
+        try:
+            done, _ = await asyncio.wait([waiter, *self.tasks], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+        if waiter not in done:
+            self.check_stages()
+            raise RuntimeError("Batch processing stopped")
+        return waiter.result()
+
+    async def put(self, item):
+        self.check_stages()
+        if self.message_queue.full():
+            await self.wait_for(self.message_queue.put(item))
+        else:
+            self.message_queue.put_nowait(item)
+
+    # Indicators come from every message fetched, before keyword filtering and deduplication drop any,
+    # so the same indicator reposted elsewhere still counts towards its channels
+    def add_indicators(self, messages, channel_name):
+        if self.iocs and messages:
+            with metrics.timer('telehunting_ioc_seconds'):
+                sightings = self.iocs.add(messages, channel_name)
+            metrics.inc('telehunting_ioc_sightings_total', sum(count for count, _, _ in sightings.values()))
+
+    # on_written runs once these messages, and everything handed over before them, are saved. Crawl state
+    # that says the messages were fetched (checkpoints) only moves from there, never ahead of the output.
+    # A future is resolved at that point instead, even when a batch was lost on the way.
+    async def add_messages(self, messages, channel_name, affiliated_channel, channel_id=None, on_written=None):
+        self.received_messages += len(messages)
+        if messages or on_written:
+            await self.put((messages, channel_name, affiliated_channel, channel_id, on_written))
+
+    async def score_stage(self):
+        while True:
+            item = await self.message_queue.get()
+            if item is None:
+                await self.score_batch()  # Score any remaining messages
+                await self.write_queue.put(None)
+                return
+            if item is self.FLUSH:
+                await self.score_batch()
+                continue
+            messages, channel_name, affiliated_channel, channel_id, on_written = item
+            if messages and self.dedup:
+                messages = await self.deduplicate(messages, channel_name)
+            if messages:
+                self.total_messages += len(messages)
+                self.batch.extend(messages, channel_name, affiliated_channel if affiliated_channel else "Initial Config", channel_id)
+            if on_written:
+                self.on_written.append(on_written)
+            if len(self.batch) >= self.batch_size:
+                await self.score_batch()
+
+    # MinHash signatures are computed on a thread so they don't hold up the crawl. Only the scoring stage
+    # deduplicates, one page of messages at a time, so the deduplicator is never used from two threads at once.
+    async def deduplicate(self, messages, channel_name):
+        with metrics.timer('telehunting_dedup_seconds'):
+            kept, duplicates = await asyncio.get_running_loop().run_in_executor(None, self.dedup.filter, messages, channel_name)
+        self.dedup.record(duplicates)
+        metrics.inc('telehunting_duplicates_total', len(messages) - len(kept))
+        return kept
+
+    async def score_batch(self):
+        callbacks, self.on_written = self.on_written, []
+        if not self.batch:
+            # Nothing to save, but the callbacks still wait their turn behind the batches ahead of them
+            if callbacks:
+                await self.write_queue.put((None, None, callbacks))
+            return
+        df = self.batch.to_dataframe()
+        self.batch.clear()
+        try:
+            with metrics.timer('telehunting_score_batch_seconds'):
+                scores = await self.score(df['Message'].tolist())
+        except Exception as e:
+            print_error(f"Failed to score a batch of {len(df)} messages: {e}")
+            self.batch_lost = True
+            await self.write_queue.put((None, None, callbacks))
+            return
+        df['Sentiment'] = [dict(zip(SENTIMENT_FIELDS, row)) for row in scores.tolist()]
+        df['Compound_Sentiment'] = scores[:, SENTIMENT_FIELDS.index('compound')]
+        await self.write_queue.put((df, scores, callbacks))
+
+    # Each distinct text is scored once. Worker processes get the texts sharded by hash, so a text reposted
+    # in a later batch goes back to the worker whose cache already holds its score. When the workers fail
+    # the batch is scored on a thread of this process instead.
+    async def score(self, texts):
+        loop = asyncio.get_running_loop()
+        unique_texts = list(dict.fromkeys(texts))
+        scores = None
+        if self.executors:
+            shards = [[] for _ in self.executors]
+            for text in unique_texts:
+                shards[hash(text) % len(shards)].append(text)
+            try:
+                parts = await asyncio.gather(*(
+                    loop.run_in_executor(executor, score_texts, shard)
+                    for executor, shard in zip(self.executors, shards) if shard
+                ))
+            except Exception as e:
+                print_warning(f"Sentiment workers failed to score a batch ({e}), scoring it in this process")
+                if isinstance(e, BrokenProcessPool):
+                    self.shutdown_workers()
+            else:
+                unique_texts = [text for shard in shards for text in shard]
+                scores = np.concatenate(parts)
+        if scores is None:
+            scorer = self.cybersecurity_sia.score_batch if self.cybersecurity_sia else score_texts
+            scores = await loop.run_in_executor(None, scorer, unique_texts)
+        positions = {text: i for i, text in enumerate(unique_texts)}
+        return scores[[positions[text] for text in texts]]
+
+    def shutdown_workers(self):
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.executors = []
+
+    async def write_stage(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.write_queue.get()
+            if item is None:
+                return
+            df, scores, callbacks = item
+            try:
+                if df is not None:
+                    await loop.run_in_executor(None, self.save_batch, df, scores)
+            except Exception as e:
+                print_error(f"Failed to save batch {self.sink.batch_counter}: {e}")
+                self.batch_lost = True
+            # Once a batch is lost nothing after it is confirmed either, the next run fetches those messages again
+            if not self.batch_lost:
+                self.run_callbacks(callbacks)
+            for waiter in callbacks:
+                if isinstance(waiter, asyncio.Future) and not waiter.done():
+                    waiter.set_result(None)
+            # The one place crawl state is committed while crawling. Whatever else sits in the transaction
+            # (cached entities, frontier links, memberships) is safe to keep without the messages behind it.
+            if self.state is not None:
+                self.state.commit()
+
+    def run_callbacks(self, callbacks):
+        for callback in callbacks:
+            if isinstance(callback, asyncio.Future):
+                continue
+            try:
+                callback()
+            except Exception as e:
+                print_error(f"Failed to record saved messages in the crawl state: {e}")
+
+    def save_batch(self, df, scores):
+        batch_number = self.sink.batch_counter
+        with metrics.timer('telehunting_save_batch_seconds'):
+            batch_filename = self.sink.write(df, scores)
+        if self.index:
+            with metrics.timer('telehunting_index_batch_seconds'):
+                self.index.add(df)
+        metrics.inc('telehunting_messages_written_total', len(df))
+        print_success(f"Saved batch {batch_number} with {len(df)} messages to {batch_filename}")
+        
+        # Only the running report statistics outlive the batch
+        self.report.update(df['Message'].tolist(), scores)
 
     def generate_final_report(self):
-        print_info(f"Generating final report. Total messages: {len(self.all_messages_df)}")
+        print_info(f"Generating final report. Total messages: {self.report.total_messages}")
         
-        if self.all_messages_df.empty:
+        if not self.report.total_messages:
             print_warning("No messages to generate report from.")
             return
         
-        generate_sentiment_report(self.all_messages_df)
+        try:
+            self.report.write()
+        except Exception as e:
+            print_error(f"Error generating sentiment report: {e}")
 
-    def finalize(self):
-        self.save_batch()  # Save any remaining messages
+    # Drain both stages (saving any partial batch) and stop the worker processes
+    async def close(self):
+        if self.tasks:
+            try:
+                await self.put(None)
+                await asyncio.wait(self.tasks, return_when=asyncio.FIRST_EXCEPTION)
+                self.check_stages()
+            finally:
+                for task in self.tasks:
+                    task.cancel()
+                self.tasks = []
+                self.sink.close()
+                if self.index:
+                    self.index.close()
+        for executor in self.executors:
+            executor.shutdown()
+        self.executors = []
+
+    async def finalize(self):
+        await self.close()
         self.generate_final_report()
 
-    def __del__(self):
-        self.save_batch()  # Save any remaining messages when the object is destroyed
-
 # pretty much our main func at this point
-async def run_scraper(config, message_depth, channel_depth):
-    await client.start()
+async def run_scraper(config, message_depth, channel_depth, concurrency=4, requests_per_second=1.0, state_db='telehunting_state.db', backfill=False, resume=False, sentiment_workers=0, sink=None, keywords_only=False, monitor=False, flush_interval=30, accounts=None, metrics_port=None, metrics_file=None, metrics_interval=15, progress_interval=10, dedup=None, index=None, join_mode='auto', membership_limit=500, takeout=False, iocs=None):
+    if not logger.handlers:
+        setup_logging()
+    accounts = accounts or [Account('session_name', client)]
+    for account in accounts:
+        if account.phone_number:
+            await account.client.start(phone=account.phone_number)
+        else:
+            await account.client.start()
+        # Surface every FloodWait to the rate limiter instead of letting Telethon sleep through the short ones
+        account.client.flood_sleep_threshold = 0
     
-    signal.signal(signal.SIGINT, signal_handler)
+    install_interrupt_handler(asyncio.current_task())
     
+    state = open_state_db(state_db)
+    batch_processor = None
+    metrics_server = None
+    metrics_task = None
+    takeouts = AsyncExitStack()
     try:
-        channel_manager = ChannelManager()
-        cybersecurity_sia = CybersecuritySentimentAnalyzer()
-        batch_processor = BatchProcessor(cybersecurity_sia=cybersecurity_sia)
+        crawl_state = CrawlStateStore(state)
+        channel_manager = ChannelManager(store=crawl_state)
+        if dedup:
+            dedup.store = DuplicateStore(state)
+        if iocs:
+            iocs.store = IocStore(state)
+        batch_processor = BatchProcessor(batch_size=config.get('batch_size', 1000), workers=sentiment_workers, sink=sink, dedup=dedup, index=index, iocs=iocs, state=state)
+        batch_processor.start()
+        
+        metrics.gauge('telehunting_frontier_size', lambda: len(channel_manager.discovered_channels))
+        metrics.gauge('telehunting_channels_in_progress', lambda: len(channel_manager.in_progress_channels))
+        metrics.gauge('telehunting_channels_joined', lambda: len(channel_manager.joined_channels))
+        metrics.gauge('telehunting_channels_processed', lambda: len(channel_manager.processed_channels))
+        metrics.gauge('telehunting_queue_depth', lambda: batch_processor.message_queue.qsize(), queue='score')
+        metrics.gauge('telehunting_queue_depth', lambda: batch_processor.write_queue.qsize(), queue='write')
+        metrics.gauge('telehunting_batch_buffered_messages', lambda: len(batch_processor.batch))
+        if metrics_port:
+            metrics_server = await start_metrics_server(metrics_port)
+        if metrics_file:
+            metrics_task = asyncio.create_task(dump_metrics(metrics_file, metrics_interval))
+        # Every account has its own flood limits, the first one keeps the single-account cache layout
+        for index, account in enumerate(accounts):
+            account.rate_limiter = RateLimiter(requests_per_second)
+            account.entity_cache = EntityCache(state, account=account.name if index else None)
+            account.memberships = MembershipManager(state, account.client, account.rate_limiter, account.name, membership_limit, join_mode, keep_joined=monitor)
+            metrics.gauge('telehunting_memberships', lambda account=account: len(account.memberships), account=account.name)
+            if takeout:
+                try:
+                    account.history_client = await takeouts.enter_async_context(account.client.takeout(finalize=True, channels=True, megagroups=True))
+                    print_success(f"Takeout session open for {account.name}, history is fetched under bulk export limits")
+                except errors.TakeoutInitDelayError as e:
+                    print_warning(f"Telegram delays the takeout session for {account.name} by {e.seconds}s (confirm it in the Telegram app), fetching history normally")
+        labelled = len(accounts) > 1
+        checkpoints = CheckpointStore(state)
+        keywords = KeywordMatcher(config.get('message_keywords', []), config.get('keyword_word_boundaries', True))
+        if keywords_only and not keywords:
+            print_warning("--keywords-only given without any message_keywords, keeping every message")
+            keywords_only = False
+        
+        if resume:
+            channel_manager.resume()
+            print_info(f"Resuming crawl: {len(channel_manager.discovered_channels)} channels queued, {len(channel_manager.processed_channels)} already processed")
+        else:
+            crawl_state.reset()
         
         # Add initial channels from config
         for link in config['initial_channel_links']:
             channel_manager.add_channel(link)
+        crawl_state.commit()
         
         start_time = datetime.now()
         print_header(f"Scraping started at {start_time}")
 
-        depth = 0
-        while channel_manager.has_unprocessed_channels() and depth < channel_depth:
+        # Each level only holds links exactly `depth` hops from the seeds, links found while
+        # crawling it wait for the next level, and nothing beyond --channel-depth is crawled
+        for depth in range(channel_manager.min_pending_depth(), channel_depth):
+            if not channel_manager.has_unprocessed_channels(depth):
+                break
             print_subheader(f"Crawling at depth {depth + 1}/{channel_depth}")
             channel_manager.display_status()
+            for account in accounts:
+                account.rate_limiter.display_budget(account.name if labelled else None)
             
-            await process_channels(client, channel_manager, message_depth, config['message_keywords'], batch_processor)
-            
-            depth += 1
-            
-            # Allow time for rate limiting
-            await asyncio.sleep(5)
+            progress = ProgressReporter(f"Depth {depth + 1}/{channel_depth}", channel_manager.discovered_channels.pending(depth), channel_manager, batch_processor, progress_interval)
+            progress_task = asyncio.create_task(progress.run())
+            try:
+                await process_channels(None, channel_manager, message_depth, keywords, batch_processor, concurrency=concurrency, checkpoints=checkpoints, backfill=backfill, depth=depth, keywords_only=keywords_only, accounts=accounts)
+            finally:
+                progress_task.cancel()
+            progress.summary()
         
         end_time = datetime.now()
         duration = end_time - start_time
+        # Deduplication and the message totals happen in the scoring stage, let it catch up with the crawl first
+        await batch_processor.flush()
         print_header(f"Scraping completed at {end_time}")
         print_info(f"Total duration: {duration}")
-        print_info(f"Total messages scraped: {batch_processor.total_messages}")
+        print_info(f"Total messages scraped: {batch_processor.received_messages}")
+        if dedup:
+            print_info(f"Messages kept after deduplication: {batch_processor.total_messages}")
+            dedup.display_stats()
+        if iocs:
+            iocs.display_stats()
         print_info(f"Total channels processed: {len(channel_manager.processed_channels)}")
+        for account in accounts:
+            account.rate_limiter.display_budget(account.name if labelled else None)
+            account.entity_cache.display_stats()
+            account.memberships.display_stats()
+        
+        if monitor:
+            await monitor_channels(accounts, channel_manager, keywords, batch_processor, checkpoints, keywords_only, flush_interval,
+                                   message_depth, channel_depth, concurrency)
+            print_info(f"Total messages scraped: {batch_processor.received_messages}")
 
         # Finalize batch processing and generate report
-        batch_processor.finalize()
+        await batch_processor.finalize()
 
+    except asyncio.CancelledError:
+        print_warning(f"\nKeyboard interrupt received. Saving current batch and crawl state, rerun with --resume to continue...")
     except Exception as e:
         print_error(f"An error occurred during scraping: {e}")
     finally:
-        await client.disconnect()
-
-async def process_all_channels(client, channel_manager, message_depth, keywords):
-    all_messages = []
-    channels_to_process = list(channel_manager.discovered_channels)
-    
-    for link in channels_to_process:
-        try:
-            join_success = await retry_with_backoff(join_channel(client, channel_manager, link))
-            if join_success:
-                entity = await client.get_entity(link)
-                entity_name = await get_entity_name(entity)
-                print_info(f"Scraping messages from: {entity_name}")
-                entity_messages = await scrape_messages(client, entity, message_depth, keywords, channel_manager)
-                all_messages.extend(entity_messages)
-                
-                # Process newly discovered channels
-                new_channels = channel_manager.get_new_channels()
-                for new_link in new_channels:
-                    channel_manager.add_channel(new_link)
-            else:
-                print_warning(f"Skipping entity {link} due to joining failure")
-        except Exception as e:
-            print_error(f"Failed to process entity {link}: {e}")
-        
-        await asyncio.sleep(1)  # Small delay between processing channels
-    
-    return all_messages
-
-async def process_discovered_channels(client, channel_manager, message_depth, keywords, max_channels_per_depth):
-    channels_processed = 0
-    while channel_manager.discovered_channels and channels_processed < max_channels_per_depth:
-        link = channel_manager.get_next_channel()
-        if await join_channel(client, channel_manager, link):
+        # The crawl state is committed whatever happens to the last batch or the metrics
+        if batch_processor:
             try:
-                channel = await client.get_entity(link)
-                print_info(f"Scraping messages from newly discovered channel: {channel.title}")
-                await scrape_messages(client, channel, message_depth, keywords, channel_manager)
-                channels_processed += 1
+                await batch_processor.close()
             except Exception as e:
-                print_error(f"Failed to scrape newly discovered channel {link}: {e}")
-        
-        await asyncio.sleep(2)
+                print_error(f"Failed to save the last batch: {e}")
+        await takeouts.aclose()
+        state.commit()
+        state.close()
+        if metrics_task:
+            metrics_task.cancel()
+            try:
+                write_metrics_file(metrics_file)
+            except OSError as e:
+                print_error(f"Failed to write metrics file {metrics_file}: {e}")
+        if metrics_server:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        for account in accounts:
+            await account.client.disconnect()
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['search']:
+        sys.exit(search_command(sys.argv[2:]))
+
     banner()
-    ensure_nltk_data()
 
-    parser = argparse.ArgumentParser(description='Telegram Content Crawler')
+    parser = argparse.ArgumentParser(description='Telegram Content Crawler', epilog="Run 'telehunting.py search --help' to query the full-text index of earlier crawls")
     parser.add_argument('--config', type=str, default='config.json', help='Path to the configuration file')
     parser.add_argument('--message-depth', type=int, default=1000, help='Number of messages to crawl per channel')
     parser.add_argument('--channel-depth', type=int, default=2, help='Depth of channel crawling')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of channels crawled at the same time by each account')
+    parser.add_argument('--requests-per-second', type=float, default=1.0, help='API request budget of each account, shared by its crawl workers and split between resolve, join and history calls')
+    parser.add_argument('--state-db', type=str, default='telehunting_state.db', help='SQLite file holding crawl state such as the entity cache')
+    parser.add_argument('--backfill', action='store_true', help='Also fetch up to --message-depth messages older than what earlier runs reached')
+    parser.add_argument('--takeout', action='store_true', help='Fetch history through a Telegram takeout session, whose much looser limits suit deep --backfill runs (Telegram may ask to confirm it in the app)')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted crawl from the frontier saved in --state-db')
+    parser.add_argument('--sentiment-workers', type=int, default=max(1, os.cpu_count() - 1), help='Processes scoring sentiment alongside the crawl (0 scores on a thread of the crawler)')
+    parser.add_argument('--keywords-only', action='store_true', help='Only score and store messages matching message_keywords')
+    parser.add_argument('--no-dedup', action='store_true', help='Keep reposts and forwards of messages already seen in another channel')
+    parser.add_argument('--dedup-threshold', type=float, default=0.8, help='Estimated word 3-gram similarity above which two messages count as the same')
+    parser.add_argument('--dedup-clusters', type=int, default=50000, help='Most recent distinct messages remembered for deduplication')
+    parser.add_argument('--join-mode', choices=['auto', 'always', 'never'], default='auto', help="When to join public channels: 'auto' reads their history without joining unless --monitor needs their updates, 'always' joins every one")
+    parser.add_argument('--membership-limit', type=int, default=500, help="Channels an account may be a member of, older memberships are left to make room (Telegram allows 500, 1000 with Premium)")
+    parser.add_argument('--monitor', action='store_true', help='After the crawl, keep watching joined channels for new messages until interrupted, crawling links found in them down to --channel-depth')
+    parser.add_argument('--flush-seconds', type=float, default=30, help='How often monitor mode scores and writes buffered messages')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--metrics-file', type=str, help='Periodically write a JSON snapshot of the metrics to this file')
+    parser.add_argument('--metrics-interval', type=float, default=15, help='Seconds between --metrics-file snapshots')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO', help='Console and log file verbosity, DEBUG echoes every scraped message')
+    parser.add_argument('--log-file', type=str, help='Also write the log as JSON lines to this file')
+    parser.add_argument('--progress-interval', type=float, default=10, help='Seconds between crawl progress summaries')
+    parser.add_argument('--output-format', choices=['csv', 'parquet', 'arrow'], default='csv', help='Batch output: one CSV per batch, or typed Parquet / Arrow IPC files (needs pyarrow)')
+    parser.add_argument('--output-dir', type=str, default='.', help='Directory for batch output files')
+    parser.add_argument('--compression', type=str, help='Output compression, e.g. gzip for CSV, zstd (default) or lz4 for Parquet/Arrow, snappy for Parquet only')
+    parser.add_argument('--rotate-mb', type=float, default=256, help='Start a new Arrow file once the current one reaches this size (Parquet writes a file per batch)')
+    parser.add_argument('--rotate-minutes', type=float, default=60, help='Start a new Arrow file once the current one is this old')
+    parser.add_argument('--index-db', type=str, default='telehunting_index.db', help="Full-text index of the saved messages, query it with 'telehunting.py search'")
+    parser.add_argument('--no-index', action='store_true', help='Do not write the full-text index')
+    parser.add_argument('--no-iocs', action='store_true', help='Do not extract indicators of compromise (URLs, domains, IPs, hashes, CVEs, e-mails, wallets) into the iocs table of --state-db')
     parser.add_argument('--api-id', type=str, help='API ID for Telegram client')
     parser.add_argument('--api-hash', type=str, help='API hash for Telegram client')
     parser.add_argument('--phone-number', type=str, help='Phone number for Telegram client')
     args = parser.parse_args()
+    setup_logging(args.log_level, args.log_file)
 
     config = load_config(args.config)
     if config is None:
@@ -667,11 +3103,24 @@ if __name__ == "__main__":
     api_hash = args.api_hash or API_HASH
     phone_number = args.phone_number or PHONE_NUMBER
 
-    if not api_id or not api_hash or not phone_number:
-        print_error("API credentials are missing. Please provide them either as command-line arguments or in the script. (Line 664-666)")
+    if not config.get('accounts') and (not api_id or not api_hash or not phone_number):
+        print_error("API credentials are missing. Please provide them either as command-line arguments, in the script or as config accounts.")
+        exit(1)
+
+    try:
+        sink = create_sink(args.output_format, args.output_dir, args.compression, args.rotate_mb, args.rotate_minutes)
+    except RuntimeError as e:
+        print_error(str(e))
         exit(1)
 
-    client = TelegramClient('session_name', api_id, api_hash)
+    try:
+        accounts = create_accounts(config, api_id, api_hash, phone_number)
+    except ValueError as e:
+        print_error(str(e))
+        exit(1)
+    client = accounts[0].client
+    dedup = None if args.no_dedup else MessageDeduplicator(args.dedup_threshold, max_clusters=args.dedup_clusters)
+    index = None if args.no_index else SearchIndex(args.index_db)
+    iocs = None if args.no_iocs else IocExtractor()
 
-    with client:
-        client.loop.run_until_complete(run_scraper(config, args.message_depth, args.channel_depth))
+    client.loop.run_until_complete(run_scraper(config, args.message_depth, args.channel_depth, args.concurrency, args.requests_per_second, args.state_db, args.backfill, args.resume, args.sentiment_workers, sink, args.keywords_only, args.monitor, args.flush_seconds, accounts, args.metrics_port, args.metrics_file, args.metrics_interval, args.progress_interval, dedup, index, args.join_mode, args.membership_limit, args.takeout, iocs))
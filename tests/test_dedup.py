@@ -0,0 +1,68 @@
+import random
+import sqlite3
+
+from telehunting import DuplicateStore, MessageDeduplicator, MessageRecord
+
+WORDS = ['fresh', 'logs', 'combo', 'stealer', 'crypter', 'botnet', 'cheap', 'price', 'update', 'join', 'tool', 'vpn',
+         'private', 'method', 'daily', 'drop', 'panel', 'access', 'bypass', 'leak']
+
+def record(text, forward_origin=None):
+    return MessageRecord(1, None, text, [], forward_origin)
+
+def texts(messages):
+    return [message.text for message in messages]
+
+def paragraph(rng, words=40):
+    return ' '.join(rng.choices(WORDS, k=words))
+
+def test_exact_copies_are_dropped_after_normalization():
+    dedup = MessageDeduplicator()
+    kept, duplicates = dedup.filter([record('Fresh LOGS  drop, join now'), record('fresh logs drop,\njoin now')], 'a')
+    assert texts(kept) == ['Fresh LOGS  drop, join now']
+    assert dedup.duplicates == 1
+    assert [channels for _, channels in duplicates.values()] == [{'a': 1}]
+
+def test_near_duplicates_are_dropped():
+    rng = random.Random(3)
+    original = paragraph(rng, 80).split()
+    edited = original[:]
+    edited[40] = 'CHANGED'
+    dedup = MessageDeduplicator(threshold=0.8)
+    kept, _ = dedup.filter([record(' '.join(original)), record(' '.join(edited))], 'a')
+    assert len(kept) == 1
+
+def test_different_messages_are_kept():
+    rng = random.Random(5)
+    messages = [record(paragraph(rng)) for _ in range(200)]
+    kept, duplicates = MessageDeduplicator().filter(messages, 'a')
+    assert len(kept) == len(messages) and not duplicates
+
+def test_short_messages_only_match_exactly():
+    dedup = MessageDeduplicator(min_words=5)
+    kept, _ = dedup.filter([record('join now'), record('join later'), record('join now')], 'a')
+    assert texts(kept) == ['join now', 'join later']
+
+def test_forwards_of_one_post_are_duplicates_whatever_their_text():
+    dedup = MessageDeduplicator()
+    kept, _ = dedup.filter([record('original post text', '-100123:42'), record('edited differently', '-100123:42')], 'a')
+    assert texts(kept) == ['original post text']
+
+def test_memory_is_bounded_and_evicted_messages_are_new_again():
+    rng = random.Random(11)
+    messages = [record(paragraph(rng)) for _ in range(20)]
+    dedup = MessageDeduplicator(max_clusters=10)
+    dedup.filter(messages, 'a')
+    assert len(dedup.clusters) == 10
+    assert len(dedup.exact) <= 10 and len(set(dedup.buckets.values())) <= 10
+    kept, _ = dedup.filter(messages[:1] + messages[-1:], 'b')
+    assert texts(kept) == texts(messages[:1])
+
+def test_store_counts_every_copy_in_every_channel():
+    conn = sqlite3.connect(':memory:')
+    dedup = MessageDeduplicator(store=DuplicateStore(conn))
+    post = 'fresh combo list with private access daily'
+    for channel, copies in [('a', 3), ('b', 2), ('a', 1)]:
+        _, duplicates = dedup.filter([record(post)] * copies, channel)
+        dedup.record(duplicates)
+    assert conn.execute('SELECT first_channel, copies FROM duplicate_clusters').fetchall() == [('a', 6)]
+    assert dict(conn.execute('SELECT channel, copies FROM duplicate_channels')) == {'a': 3, 'b': 2}
@@ -0,0 +1,83 @@
+from telehunting import ChannelManager, CrawlFrontier, MENTION_PENALTY, RECENCY_DAYS, RECENCY_WEIGHT
+
+def drain(frontier, depth=None):
+    keys = []
+    while frontier.has_pending(depth):
+        keys.append(frontier.pop(depth))
+    return keys
+
+def test_more_referrers_come_first():
+    frontier = CrawlFrontier()
+    frontier.add('one', 1, referrer='a')
+    for referrer in 'abc':
+        frontier.add('three', 1, referrer=referrer)
+    frontier.add('two', 1, referrer='a')
+    frontier.add('two', 1, referrer='b')
+    assert drain(frontier) == ['three', 'two', 'one']
+
+def test_keyword_heavy_referrers_come_first():
+    frontier = CrawlFrontier()
+    frontier.add('quiet', 1, referrer='a', keyword_density=0.0)
+    frontier.add('loud', 1, referrer='b', keyword_density=0.9)
+    assert drain(frontier) == ['loud', 'quiet']
+
+def test_recent_mentions_come_first_and_old_ones_add_nothing():
+    frontier = CrawlFrontier()
+    now = frontier.now
+    frontier.add('ancient', 1, referrer='a', seen_at=now - 10 * RECENCY_DAYS * 86400)
+    frontier.add('never', 1, referrer='a')
+    frontier.add('today', 1, referrer='a', seen_at=now)
+    frontier.add('last_week', 1, referrer='a', seen_at=now - 7 * 86400)
+    assert drain(frontier)[:2] == ['today', 'last_week']
+    assert frontier.entries == {}
+
+# Scoring used to add the raw epoch, so any dated mention beat every undated one whatever its referrers
+def test_recency_bonus_is_capped():
+    frontier = CrawlFrontier()
+    frontier.add('fresh', 1, referrer='a', seen_at=frontier.now)
+    frontier.add('undated', 1, referrer='a')
+    bonus = frontier.entries['fresh'].score(frontier.now) - frontier.entries['undated'].score(frontier.now)
+    assert abs(bonus - RECENCY_WEIGHT * RECENCY_DAYS) < 1e-9
+    for referrer in range(100):
+        frontier.add('popular', 1, referrer=str(referrer))
+    assert drain(frontier) == ['popular', 'fresh', 'undated']
+
+def test_mentions_rank_below_links_until_linked():
+    frontier = CrawlFrontier()
+    frontier.add('mentioned', 1, referrer='a', mention=True)
+    frontier.add('linked', 1, referrer='a')
+    assert frontier.entries['linked'].score(frontier.now) - frontier.entries['mentioned'].score(frontier.now) == MENTION_PENALTY
+    frontier.add('later', 1, referrer='b', mention=True)
+    frontier.add('later', 1, referrer='c')
+    assert drain(frontier) == ['later', 'linked', 'mentioned']
+
+def test_levels_are_popped_separately_and_an_entry_moves_to_its_shallowest_depth():
+    frontier = CrawlFrontier()
+    frontier.add('deep', 2, referrer='a')
+    frontier.add('shallow', 1, referrer='a')
+    frontier.add('moved', 2, referrer='a')
+    frontier.add('moved', 1, referrer='b')
+    assert frontier.min_depth() == 1
+    assert frontier.pending(1) == 2 and frontier.pending(2) == 1
+    assert drain(frontier, 1) == ['moved', 'shallow']
+    assert frontier.min_depth() == 2
+    assert drain(frontier) == ['deep']
+    assert frontier.pop() is None
+
+def test_discarded_entries_are_not_popped_or_counted():
+    frontier = CrawlFrontier()
+    for key in 'abc':
+        frontier.add(key, 0)
+    frontier.discard('b')
+    frontier.discard('missing')
+    assert frontier.pending(0) == 2
+    assert sorted(drain(frontier, 0)) == ['a', 'c']
+    assert not frontier.has_pending()
+
+def test_channel_manager_skips_links_already_processed():
+    manager = ChannelManager()
+    manager.add_channel('https://t.me/seen_channel')
+    assert manager.get_next_channel(0) == 'seen_channel'
+    manager.mark_as_processed('seen_channel')
+    manager.add_channel('@seen_channel', source_channel='other', depth=1)
+    assert not manager.has_unprocessed_channels()
@@ -0,0 +1,82 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import replay
+from telehunting import ChannelManager, CheckpointStore, RateLimiter, plan_history, scrape_messages
+
+def test_plan_for_a_channel_never_seen_is_newest_first():
+    assert plan_history(None) == [(False, 0)]
+    assert plan_history(None, backfill=True) == [(False, 0)]
+
+def test_plan_continues_oldest_first_from_the_high_water_mark():
+    assert plan_history((250, 151)) == [(True, 250)]
+
+def test_backfill_adds_a_pass_below_the_oldest_message():
+    assert plan_history((250, 151), backfill=True) == [(True, 250), (False, 151)]
+    assert plan_history((250, 1), backfill=True) == [(True, 250)]
+
+def test_checkpoints_only_widen():
+    checkpoints = CheckpointStore(sqlite3.connect(':memory:'))
+    assert checkpoints.get(1) is None
+    checkpoints.update(1, 200, 101)
+    checkpoints.update(1, 150, 120)
+    assert checkpoints.get(1) == (200, 101)
+    checkpoints.update(1, 300, 50)
+    assert checkpoints.get(1) == (300, 50)
+
+class History:
+    def __init__(self, messages=250):
+        self.data = replay.ReplayData.synthetic(channels=1, messages=0, links_per_channel=0)
+        self.channel = next(iter(self.data.channels.values()))
+        self.channel.ids = range(1, messages + 1)
+        self.client = replay.ReplayClient(self.data)
+        self.checkpoints = CheckpointStore(sqlite3.connect(':memory:'))
+
+    def scrape(self, limit, backfill=False):
+        records, _ = asyncio.run(scrape_messages(self.client, self.client.entity(self.channel), limit, [], ChannelManager(),
+                                                 rate_limiter=RateLimiter(1000), checkpoints=self.checkpoints, backfill=backfill))
+        return records
+
+    # Records don't carry message ids, but synthetic message n is dated n minutes after replay.EPOCH
+    def ids(self, records):
+        return sorted(int(record.date.timestamp() - replay.EPOCH.timestamp()) // 60 for record in records)
+
+    def add_messages(self, count):
+        last = self.channel.ids[-1]
+        self.channel.ids = range(1, last + count + 1)
+
+@pytest.fixture
+def history():
+    return History()
+
+def test_first_scrape_takes_the_newest_messages(history):
+    records = history.scrape(100)
+    assert history.ids(records) == list(range(151, 251))
+    assert history.checkpoints.get(history.channel.id) == (250, 151)
+
+def test_rescrape_only_fetches_new_messages_oldest_first(history):
+    history.scrape(100)
+    assert history.scrape(100) == []
+    history.add_messages(30)
+    assert history.ids(history.scrape(100)) == list(range(251, 281))
+    assert history.checkpoints.get(history.channel.id) == (280, 151)
+
+def test_capped_catch_up_leaves_no_gap(history):
+    history.scrape(100)
+    history.add_messages(250)
+    fetched = []
+    while True:
+        records = history.scrape(100)
+        if not records:
+            break
+        fetched += history.ids(records)
+    assert fetched == list(range(251, 501))
+
+def test_backfill_pages_towards_the_first_message(history):
+    history.scrape(100)
+    assert history.ids(history.scrape(100, backfill=True)) == list(range(51, 151))
+    assert history.ids(history.scrape(100, backfill=True)) == list(range(1, 51))
+    assert history.checkpoints.get(history.channel.id) == (250, 1)
+    assert history.scrape(100, backfill=True) == []
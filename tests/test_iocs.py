@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from telehunting import IocExtractor, MessageRecord, extract_iocs, refang
+
+def indicators(text):
+    return [(kind, value) for _, kind, value in extract_iocs([text])]
+
+@pytest.mark.parametrize('defanged, refanged', [
+    ('hxxp://evil[.]com/a', 'http://evil.com/a'),
+    ('hXXps[://]evil(.)com', 'https://evil.com'),
+    ('user[at]evil[dot]com', 'user@evil.com'),
+    ('user(@)evil{.}com', 'user@evil.com'),
+    ('10[.]0[.]0[.]1', '10.0.0.1'),
+    ('a list [a, b] stays as it is', 'a list [a, b] stays as it is'),
+])
+def test_refang(defanged, refanged):
+    assert refang(defanged) == refanged
+
+def test_defanged_indicators_are_found():
+    assert indicators('drop at hxxps://Evil[.]COM/Payload.exe, mail root[at]evil[.]com') == [
+        ('url', 'https://evil.com/Payload.exe'), ('domain', 'evil.com'), ('email', 'root@evil.com')]
+
+@pytest.mark.parametrize('text, expected', [
+    ('CVE-2024-3094', [('cve', 'CVE-2024-3094')]),
+    ('cve-2021-44228', [('cve', 'CVE-2021-44228')]),
+    ('d41d8cd98f00b204e9800998ecf8427e', [('md5', 'd41d8cd98f00b204e9800998ecf8427e')]),
+    ('DA39A3EE5E6B4B0D3255BFEF95601890AFD80709', [('sha1', 'da39a3ee5e6b4b0d3255bfef95601890afd80709')]),
+    ('e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855', [('sha256', 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855')]),
+    ('0x52908400098527886E0F7030069857D2E4169EE7', [('eth', '0x52908400098527886e0f7030069857d2e4169ee7')]),
+    ('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa', [('btc', '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa')]),
+    ('192.168.1.254', [('ipv4', '192.168.1.254')]),
+    ('2001:DB8:0:0:0:0:0:1', [('ipv6', '2001:db8::1')]),
+    ('https://[2001:db8::1]:443/a', [('url', 'https://[2001:db8::1]:443/a'), ('ipv6', '2001:db8::1')]),
+    ('http://1.2.3.4:8080/x', [('url', 'http://1.2.3.4:8080/x'), ('ipv4', '1.2.3.4')]),
+])
+def test_classification(text, expected):
+    assert indicators(f"seen {text} today") == expected
+
+@pytest.mark.parametrize('text', [
+    'Mr.Smith said hi',
+    'run main.py then setup.sh',
+    '12345678901234567890123456789012',  # all digits, not a hash
+    '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb',  # bad checksum
+    '999.1.1.1',
+    'version 1.2.3.4.5',
+    'https://t.me/somechannel',
+    'meet at 10:30:00',
+])
+def test_lookalikes_are_not_indicators(text):
+    assert indicators(text) == []
+
+def test_indicators_are_attributed_to_their_message():
+    found = extract_iocs(['nothing here', 'evil.com and CVE-2024-0001', 'evil.com again'])
+    assert found == [(1, 'domain', 'evil.com'), (1, 'cve', 'CVE-2024-0001'), (2, 'domain', 'evil.com')]
+
+def test_extractor_counts_sightings_with_first_and_last_seen():
+    first, last = datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 1, 3, tzinfo=timezone.utc)
+    messages = [MessageRecord(1, first, 'evil.com'), MessageRecord(1, None, 'clean'), MessageRecord(1, last, 'evil[.]com twice evil.com')]
+    sightings = IocExtractor().add(messages, 'channel')
+    assert sightings == {('domain', 'evil.com'): [2, first.timestamp(), last.timestamp()]}
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from telehunting import KeywordMatcher
+
+WORDS = ['hack', 'hacker', 'carding', 'malware', 'exploit', 'zero-day', 'c2', 'rat', 'stealer', 'logs', 'free', 'combo']
+
+# The crawler used to keep a message when any keyword was a case-insensitive substring of it
+def substring_matches(keywords, text):
+    return {keyword for keyword in keywords if keyword.lower() in text.lower()}
+
+def random_text(rng):
+    pieces = rng.choices(WORDS + ['the', 'a', 'new', 'Channel', 'HACK', 'MalWare', 'xploit', '-', '.', '!', '123'], k=rng.randint(0, 30))
+    separators = rng.choices(['', ' ', ' ', '\n', ', '], k=len(pieces))
+    return ''.join(piece + separator for piece, separator in zip(pieces, separators))
+
+def test_substring_mode_is_equivalent_to_substring_matching():
+    rng = random.Random(7)
+    for _ in range(2000):
+        keywords = rng.sample(WORDS, rng.randint(1, len(WORDS)))
+        text = random_text(rng)
+        matcher = KeywordMatcher(keywords, word_boundaries=False)
+        assert set(matcher.match(text)) == substring_matches(keywords, text), text
+
+def test_word_boundaries_reject_keywords_inside_words():
+    matcher = KeywordMatcher(['rat', 'hack'])
+    assert matcher.match('pirated hacks') == []
+    assert matcher.match('new RAT builder, hack tools') == ['rat', 'hack']
+
+def test_keywords_with_punctuation_only_need_boundaries_at_word_characters():
+    matcher = KeywordMatcher(['zero-day', 'c#', '.onion'])
+    assert matcher.match('selling a zero-day for c#, see x.onion') == ['zero-day', 'c#', '.onion']
+
+def test_matches_come_in_order_of_first_occurrence_without_repeats():
+    matcher = KeywordMatcher(['malware', 'exploit', 'logs'])
+    assert matcher.match('logs and an exploit, more logs, malware, exploit') == ['logs', 'exploit', 'malware']
+
+def test_overlapping_keywords_are_all_found():
+    matcher = KeywordMatcher(['hack', 'hacker', 'hackers'], word_boundaries=False)
+    assert set(matcher.match('hackers wanted')) == {'hack', 'hacker', 'hackers'}
+
+@pytest.mark.parametrize('text', ['ＭＡＬＷＡＲＥ sample', 'MALWARE sample', 'Malware sample'])
+def test_matching_ignores_case_and_compatibility_forms(text):
+    assert KeywordMatcher(['malware']).match(text) == ['malware']
+
+def test_duplicate_and_empty_keywords_are_dropped():
+    matcher = KeywordMatcher(['Hack', 'hack', '  ', ''])
+    assert len(matcher) == 1
+    assert matcher.match('hack') == ['Hack']
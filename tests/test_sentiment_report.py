@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from telehunting import SENTIMENT_CATEGORIES, SENTIMENT_FIELDS, SentimentReport, interpret_overall_score
+
+# The report as it was computed over one DataFrame holding every message of the crawl
+def reference_report(df):
+    df = df.copy()
+    df['Compound_Sentiment'] = pd.to_numeric(df['Compound_Sentiment'], errors='coerce')
+    avg_sentiment = pd.DataFrame(df['Sentiment'].dropna().tolist()).mean()
+    categories = df['Compound_Sentiment'].apply(lambda x:
+        'High Alert' if x <= -0.5 else
+        'Potential Threat' if -0.5 < x <= -0.1 else
+        'Neutral' if -0.1 < x < 0.1 else
+        'Potentially Positive' if 0.1 <= x < 0.5 else
+        'Very Positive'
+    ).value_counts()
+    total_messages = len(df)
+    overall_score = avg_sentiment.get('compound', 0) * 100
+    report = f"""
+Sentiment Analysis Report
+{'-' * 50}
+Total messages analyzed: {total_messages}
+
+Overall Sentiment Score: {overall_score:.1f}/100
+Interpretation: 
+{interpret_overall_score(overall_score)}
+
+Message Sentiment Breakdown:
+"""
+    for category, description in SENTIMENT_CATEGORIES:
+        count = categories.get(category, 0)
+        report += f"{category} ({description}): {count} messages ({count / total_messages * 100:.1f}%)\n"
+    report += f"\nTop 5 Most Concerning Messages (Potential Threats):\n"
+    for _, row in df.nsmallest(5, 'Compound_Sentiment').iterrows():
+        report += f"- {row['Message'][:100]}... (Threat Level: {abs(row['Compound_Sentiment']) * 100:.1f}/100)\n"
+    report += f"\nTop 5 Most Positive Messages (Potential Security Improvements):\n"
+    for _, row in df.nlargest(5, 'Compound_Sentiment').iterrows():
+        report += f"- {row['Message'][:100]}... (Positivity Level: {row['Compound_Sentiment'] * 100:.1f}/100)\n"
+    return report
+
+# Scored messages with coarse compounds so the top lists have ties, and some messages never scored
+def scored_messages(count, seed):
+    rng = np.random.default_rng(seed)
+    scores = rng.dirichlet(np.ones(3), count)
+    compounds = np.round(rng.uniform(-1, 1, count), 1)
+    sentiments = [dict(zip(SENTIMENT_FIELDS, (*row, compound))) for row, compound in zip(scores.tolist(), compounds.tolist())]
+    unscored = rng.random(count) < 0.05
+    return pd.DataFrame({
+        'Message': [f"message {i} " + 'x' * int(rng.integers(0, 150)) for i in range(count)],
+        'Sentiment': [None if missing else sentiment for sentiment, missing in zip(sentiments, unscored)],
+        'Compound_Sentiment': np.where(unscored, np.nan, compounds),
+    })
+
+def streamed_report(df, batch_size, path):
+    report = SentimentReport()
+    for start in range(0, len(df), batch_size):
+        report.update_from_dataframe(df.iloc[start:start + batch_size])
+    report.write(path)
+    return path.read_text(encoding='utf-8')
+
+@pytest.mark.parametrize('count, batch_size, seed', [(1, 1, 0), (7, 3, 1), (500, 1, 2), (500, 64, 3), (2000, 2000, 4)])
+def test_streamed_report_matches_the_whole_corpus_report(tmp_path, count, batch_size, seed):
+    df = scored_messages(count, seed)
+    assert streamed_report(df, batch_size, tmp_path / 'report.txt') == reference_report(df)
+
+def test_update_with_score_arrays_matches_dataframe_update():
+    df = scored_messages(300, 5)
+    from_frame, from_arrays = SentimentReport(), SentimentReport()
+    from_frame.update_from_dataframe(df)
+    scores = np.array([[sentiment[field] for field in SENTIMENT_FIELDS] if sentiment else [np.nan] * len(SENTIMENT_FIELDS) for sentiment in df['Sentiment']])
+    from_arrays.update(df['Message'].tolist(), scores)
+    assert from_arrays.category_counts == from_frame.category_counts
+    assert from_arrays.most_concerning == from_frame.most_concerning
+    assert from_arrays.most_positive == from_frame.most_positive
+    assert np.allclose(from_arrays.sentiment_sums, from_frame.sentiment_sums)